@@ -1,12 +1,17 @@
 import base64
+import os
 import dash
 import dash_table
 import dash_html_components as html
 import dash_core_components as dcc
+import flask
 import pandas as pd
 import plotly.graph_objects as go
 
 from dash.dependencies import Input, Output, State
+from callback_cache import CallbackCache
+from dashboard_data import (build_payloads, build_topic_cube, data_version, load_dashboard_data, load_payloads,
+                            load_topic_data, topic_counts)
 
 # Define styles and local images
 external_stylesheets = ['assets/style.css']
@@ -18,24 +23,33 @@ encoded_image_git = base64.b64encode(open(git_logo, 'rb').read())
 app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
 server = app.server
 
-# Load data using number of topics as indices
-df = pd.read_pickle(r'data/sttm_all_topics.pkl')
+# Cache the results of the callbacks that only depend on their inputs, optionally on disk for all workers;
+# the keys include the version of the data files so a rebuild of data/dashboard invalidates them
+callback_cache = CallbackCache(maxsize=int(os.environ.get('CALLBACK_CACHE_SIZE', 256)),
+                               ttl=float(os.environ.get('CALLBACK_CACHE_TTL', 3600)),
+                               directory=os.environ.get('CALLBACK_CACHE_DIR'),
+                               version=data_version(r'data/dashboard'))
 
-# Load data for words in each topic and corresponding scores
-topic_words_df = pd.read_pickle(r'data/topic_words.pkl')
 
-# Load data for topic name descriptions
-topic_names_df = pd.read_pickle(r'data/topic_names.pkl')
+@server.route('/cache-info')
+def cache_info():
+    """
+    returns the hit and miss counters of the callback cache of this worker
+    """
+    return flask.jsonify(dict(callback_cache.info(), pid=os.getpid()))
 
-# Convert date to datetime
-df['date'] = pd.to_datetime(df['date'], errors='coerce')
-# Add column for year
-df['year'] = df['date'].dt.year
+# Load tweets and their dominant topic for each number of topics (memory mapped, see dashboard_data.py)
+dashboard_data = load_dashboard_data(r'data/dashboard')
 
-# Make a copy of data frames
-dfc = df.copy()
-topic_words_dfc = topic_words_df.copy()
-topic_names_dfc = topic_names_df.copy()
+# Load data for words in each topic and corresponding scores, and for topic name descriptions
+topic_words_df, topic_names_df = load_topic_data(r'data/dashboard')
+
+# Load the bubble chart and topic table of every number of topics, precomputed by merge_sttm_results.py
+# (they are built from the topic data at startup when the payloads file is missing)
+if os.path.exists(r'data/dashboard/payloads.json'):
+    payloads = load_payloads(r'data/dashboard')
+else:
+    payloads = build_payloads(topic_words_df, topic_names_df)
 
 
 def get_options(options):
@@ -62,117 +76,25 @@ def get_marks(years_list):
     return marks_dict
 
 
-def get_filtered_df(df, num_topics):
-    """
-    returns a filtered data frame based on number of topics
-    """
-    return df[df['num_topics'] == num_topics]
-
+# Aggregate tweet counts once for all heat map filters
+topic_cube = build_topic_cube(dashboard_data)
 
-def convert_list_to_string(lst):
-    """
-    returns a single concatenated string from a list of strings
-    """
-    s = ', '.join(lst)
-    return s
+# Offer only the numbers of topics that have both tweet results and topic words and names
+topic_options = [num_topics for num_topics in topic_cube.num_topics.tolist() if num_topics in payloads]
 
-
-def get_words_from_dict(d, num_words, index):
-    """
-    returns a list of lists containing each topic's top n-words
-    num_words must be a value less than or equal to 10
-    """
-    top_words_list = [d[index][val][0] for val in range(0, num_words)]
-    top_words = convert_list_to_string(top_words_list)
-    return top_words
-
-
-# Default and filter dfs to model with 10 topics
-dfc = dfc.loc[10]
-topic_words_dfc = topic_words_dfc[topic_words_dfc['num_clusters'] == 10]
-topic_names_dfc = topic_names_dfc[topic_names_dfc['num_topics'] == 10]
-
-# Create bubble chart of words in each topic
-bubble_figure = go.Figure()
-
-trace_default_visibilities = []  # create a list to specify which topics to display by default
-
-for topic_num in topic_words_dfc.topic_num.values:
-    filtered_df = topic_words_dfc[topic_words_dfc['topic_num'] == topic_num]
-    if topic_num == 0:
-        trace_default_visibilities.append(True)
-    else:
-        trace_default_visibilities.append('legendonly')
-
-    bubble_figure.add_trace(go.Scatter(
-        name=str(topic_num + 1),
-        x=filtered_df.iloc[0]['doc_count'][0:5],
-        y=filtered_df.iloc[0]['word_importance'][0:5],
-        mode='markers+text',
-        opacity=0.6,
-        hovertext=filtered_df.iloc[0]['top_words'][0:5],
-        hoverlabel=dict(font=dict(color='#FFFFFF')),
-        marker=dict(
-            size=filtered_df.iloc[0]['num_topic_occurence'][0:5],
-            sizemode='area',
-            sizeref=2. * max(filtered_df.iloc[0]['num_topic_occurence'][0:5]) / (40. ** 2),
-            sizemin=4
-        ),
-        text=filtered_df.iloc[0]['top_words'][0:5],
-        textposition='bottom center',
-        visible=trace_default_visibilities[topic_num])
-    )
-
-    bubble_figure.update_layout(
-        margin=dict(t=15, b=0, l=20, r=0),
-        xaxis=dict(title='Tweet Count',
-                   showgrid=False),
-        yaxis=dict(title='Word Importance',
-                   showgrid=False),
-        font=dict(color='white'),
-        legend=dict(
-            itemsizing='constant',
-            title=dict(text='   Topic #')),
-        paper_bgcolor='rgba(0,0,0,0)',
-        plot_bgcolor='rgba(0,0,0,0)'
-    )
+# Default to model with 10 topics
+bubble_figure = payloads[10]['figure']
 
 # Create a global variable to store trace visibilities and access from functions
-global_trace_visibilities = trace_default_visibilities.copy()
-
-# Create data table of topic descriptions
-topic_desc_df = pd.DataFrame(data=[topic_names_dfc.topic_names.iloc[0].keys(),
-                                   topic_names_dfc.topic_names.iloc[0].values()]).T
-topic_desc_df.columns = ['Topic', 'Description']
-topic_desc_df['Topic'] += 1  # increment topic # so there is not a 'topic 0'
-
-n_topics = len(dfc['dominant_topic'].unique())  # get number of topics
-years_range = dfc['year'].unique()  # create list of years range
-news_sources = dfc['username'].unique()  # create list of new sources
-
-# Create pivot table of users vs topics
-user_topic_counts = pd.pivot_table(data=dfc,
-                                   values='name',
-                                   index='username',
-                                   columns='dominant_topic',
-                                   aggfunc='count',
-                                   fill_value=0)
-
-user_topic_counts.columns = ['Topic {}'.format(i) for i in range(1, n_topics + 1)]
+global_trace_visibilities = list(payloads[10]['trace_visibilities'])
+
+# Count topics per news source and per year
+user_topic_counts, year_topic_counts = topic_counts(topic_cube, 10, topic_cube.sources, topic_cube.years)
 user_topic_counts['total_topics'] = user_topic_counts.sum(axis=1)  # add column to sum total topics
 # Convert topic counts to percentages for each user
 user_topic_counts_ratio = user_topic_counts.apply(lambda x: (x / user_topic_counts['total_topics']))
 user_topic_counts_ratio = user_topic_counts_ratio.drop(columns=['total_topics'])
 
-# Create pivot table of years vs topics
-year_topic_counts = pd.pivot_table(data=dfc,
-                                   values='date',
-                                   index='year',
-                                   columns='dominant_topic',
-                                   aggfunc='count',
-                                   fill_value=0)
-year_topic_counts.columns = ['Topic {}'.format(i) for i in range(1, n_topics + 1)]
-
 nav_tab_selected_style = {
     'backgroundColor': '#434140',
     'padding': '1px'
@@ -337,8 +259,7 @@ app.layout = html.Div(
                                                             id='topics-selector',
                                                             className='div-for-dropdown',
                                                             clearable=False,
-                                                            options=get_options(
-                                                                df.index.unique()),
+                                                            options=get_options(topic_options),
                                                             value=10,
                                                             placeholder='Select number of topics'),
                                                         html.H5('Years Range: '),
@@ -359,9 +280,9 @@ app.layout = html.Div(
                                                             id='news-selector',
                                                             className='news-selector',
                                                             options=get_options(
-                                                                df['name'].unique()),
+                                                                topic_cube.sources.tolist()),
                                                             multi=True,
-                                                            value=df['name'].unique(),
+                                                            value=topic_cube.sources.tolist(),
                                                             searchable=False,
                                                             placeholder='No Sources Selected'),
                                                         html.Br(),
@@ -378,19 +299,10 @@ app.layout = html.Div(
                             children=[
                                 dash_table.DataTable(
                                     id='topic-table',
-                                    data=topic_desc_df.to_dict('records'),
-                                    columns=[{'id': c, 'name': c}
-                                             for c in topic_desc_df.columns],
+                                    data=payloads[10]['table_data'],
+                                    columns=payloads[10]['table_columns'],
                                     fixed_rows={'headers': True},
-                                    tooltip_data=[
-                                        {
-                                            'Description': 'Top 5 words: ' + get_words_from_dict(
-                                                get_filtered_df(topic_names_dfc,
-                                                                len(topic_desc_df)).iloc[0]['top_words'], 5,
-                                                topic_num)
-                                        }
-                                        for topic_num in range(0, 10)
-                                    ],
+                                    tooltip_data=payloads[10]['tooltip_data'],
                                     style_as_list_view=True,
                                     style_table={
                                         'height': '26vh',
@@ -559,56 +471,7 @@ app.layout = html.Div(
 @app.callback(Output('bubble-plot', 'figure'),
               [Input('topics-selector', 'value')])
 def update_bubble_plot(selected_num_topics):
-    topic_words_dfc = topic_words_df[topic_words_df['num_clusters'] == selected_num_topics]
-
-    bubble_figure = go.Figure()
-
-    trace_default_visibilities = []  # create a list to specify which topics to display by default
-
-    for topic_num in topic_words_dfc.topic_num.values:
-        filtered_df = topic_words_dfc[topic_words_dfc['topic_num'] == topic_num]
-        if topic_num == 0:
-            trace_default_visibilities.append(True)  # display first topic only on initialization
-        else:
-            trace_default_visibilities.append('legendonly')
-
-        bubble_figure.add_trace(go.Scatter(
-            name=str(topic_num + 1),
-            x=filtered_df.iloc[0]['doc_count'][0:5],
-            y=filtered_df.iloc[0]['word_importance'][0:5],
-            mode='markers+text',
-            opacity=0.6,
-            hovertext=filtered_df.iloc[0]['top_words'][0:5],
-            hoverlabel=dict(font=dict(color='#FFFFFF')),
-            marker=dict(
-                size=filtered_df.iloc[0]['num_topic_occurence'][0:5],
-                sizemode='area',
-                sizeref=2. * max(filtered_df.iloc[0]['num_topic_occurence'][0:5]) / (40. ** 2),
-                sizemin=4
-            ),
-            text=filtered_df.iloc[0]['top_words'][0:5],
-            textposition='bottom center',
-            visible=trace_default_visibilities[topic_num])
-        )
-
-        bubble_figure.update_layout(
-            autosize=True,
-            margin=dict(t=18, b=0, l=10, r=0, pad=0),
-            xaxis=dict(title='Tweet Count',
-                       showgrid=False,
-                       zeroline=False),
-            yaxis=dict(title='Word Importance',
-                       showgrid=False,
-                       zeroline=False),
-            font=dict(color='white'),
-            legend=dict(
-                itemsizing='constant',
-                title=dict(text='   Topic #')),
-            paper_bgcolor='rgba(0,0,0,0)',
-            plot_bgcolor='rgba(0,0,0,0)'
-        )
-
-    return bubble_figure
+    return payloads[selected_num_topics]['figure']
 
 
 @app.callback(Output('topic-trace-list', 'data'),
@@ -622,13 +485,7 @@ def refresh_traces_visibility(selected_num_topics, toggled_topic, traces):
     global_trace_visibilities = traces
 
     if input_changed == 'topics-selector.value':
-        topic_words_dfc = topic_words_df[topic_words_df['num_clusters'] == selected_num_topics]
-        global_trace_visibilities = []  # reset traces
-        for topic_num in topic_words_dfc.topic_num.values:
-            if topic_num == 0:
-                global_trace_visibilities.append(True)  # display first topic only on initialization
-            else:
-                global_trace_visibilities.append('legendonly')
+        global_trace_visibilities = list(payloads[selected_num_topics]['trace_visibilities'])  # reset traces
     elif input_changed == 'bubble-plot.restyleData':
         for i in range(0, len(toggled_topic[1])):
             temp_topic_num = toggled_topic[1][i]  # topic refers to index here
@@ -646,25 +503,8 @@ def refresh_traces_visibility(selected_num_topics, toggled_topic, traces):
                Output('topic-table', 'tooltip_data')],
               [Input('topics-selector', 'value')])
 def update_topic_descriptions(selected_num_topics):
-    filtered_df = topic_names_df[topic_names_df['num_topics'] == selected_num_topics]  # filter for number of topics
-
-    # Create data frame of topic descriptions
-    topic_desc = pd.DataFrame(data=[filtered_df.topic_names.iloc[0].keys(),
-                                    filtered_df.topic_names.iloc[0].values()]).T
-    topic_desc.columns = ['Topic', 'Description']
-    topic_desc['Topic'] += 1  # increment topic # so there is not a 'topic 0'
-
-    data = topic_desc.to_dict('records')
-    columns = [{'id': c, 'name': c} for c in topic_desc.columns]
-    tooltip_data = [{
-        'Description': 'Top 5 words: ' + get_words_from_dict(
-            filtered_df.iloc[0]['top_words'],
-            5, topic_num)
-    }
-        for topic_num in range(0, selected_num_topics)
-    ]
-
-    return data, columns, tooltip_data
+    payload = payloads[selected_num_topics]
+    return payload['table_data'], payload['table_columns'], payload['tooltip_data']
 
 
 # Callback for toggling topic descriptions based on bubble chart
@@ -692,6 +532,7 @@ def update_topics_highlighted(traces):
               [Input('topics-selector', 'value'),
                Input('news-selector', 'value'),
                Input('date-range-slider', 'value')])
+@callback_cache.memoize(unordered=(1,))  # the order of the selected news sources does not matter
 def update_heatmap(selected_num_topics, selected_sources_values, selected_range_values):
     n_topics = selected_num_topics
     if selected_sources_values is None or len(selected_sources_values) == 0:
@@ -709,30 +550,14 @@ def update_heatmap(selected_num_topics, selected_sources_values, selected_range_
         return invalid_content, invalid_content
 
     years_range = [*range(selected_range_values[0], selected_range_values[1] + 1, 1)]  # create list of years range
-    filtered_df = df[df.name.isin(selected_sources_values) & df.year.isin(years_range)]  # apply filters
-
-    user_topic_counts = pd.pivot_table(data=filtered_df.loc[n_topics],
-                                       values='name',
-                                       index='username',
-                                       columns='dominant_topic',
-                                       aggfunc='count',
-                                       fill_value=0)
-
-    user_topic_counts.columns = ['Topic {}'.format(i) for i in range(1, n_topics + 1)]
+    user_topic_counts, year_topic_counts = topic_counts(topic_cube, n_topics, selected_sources_values,
+                                                         years_range)
     user_topic_counts['total_topics'] = user_topic_counts.sum(axis=1)  # add column to sum total topics
 
     # Convert topic counts to percentages for each news source
     user_topic_counts_ratio = user_topic_counts.apply(lambda x: (x / user_topic_counts['total_topics']))
     user_topic_counts_ratio = user_topic_counts_ratio.drop(columns=['total_topics'])
 
-    year_topic_counts = pd.pivot_table(data=filtered_df.loc[n_topics],
-                                       values='date',
-                                       index='year',
-                                       columns='dominant_topic',
-                                       aggfunc='count',
-                                       fill_value=0)
-    year_topic_counts.columns = ['Topic {}'.format(i) for i in range(1, n_topics + 1)]
-
     # Store value z-values
     z_usr = user_topic_counts_ratio.values.tolist()
     z_yr = year_topic_counts.values.tolist()
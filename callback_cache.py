@@ -0,0 +1,143 @@
+"""
+@author: John Bica
+Cache for the results of the dashboard callbacks
+
+Callbacks that only depend on their inputs are memoized in a bounded in-process LRU cache whose entries
+expire after a time to live. Optionally the results are also pickled to a local directory, which all
+gunicorn workers on a host share: a result computed by one worker is then a hit for every other worker.
+Every key includes a version of the data the callbacks read, so results cached before the data was rebuilt
+are never served for the new data.
+"""
+import functools
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+
+from collections import OrderedDict
+
+
+class CallbackCache:
+    """Bounded LRU cache with a time to live for callback results, optionally backed by a disk store.
+
+    Args:
+        maxsize = maximum number of results kept in memory
+        ttl = seconds after which a result is computed again, None to keep results until evicted
+        directory = optional directory of the disk store shared between processes
+        disk_maxsize = maximum number of results kept in the disk store
+        version = identifies the data the cached results were computed from (see dashboard_data.data_version)
+    """
+
+    def __init__(self, maxsize=256, ttl=3600, directory=None, disk_maxsize=4096, version=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.directory = directory
+        self.disk_maxsize = disk_maxsize
+        self.version = version
+        self.table = OrderedDict()  # key -> (time stored, result)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def _expired(self, stored):
+        return self.ttl is not None and time.time() - stored > self.ttl
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(repr(key).encode('utf-8')).hexdigest() + '.pkl')
+
+    def _read_disk(self, key):
+        path = self._path(key)
+        try:
+            if self._expired(os.path.getmtime(path)):
+                return None
+            with open(path, 'rb') as f:
+                stored_key, stored, result = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return (stored, result) if stored_key == key else None
+
+    def _write_disk(self, key, stored, result):
+        # write to a temporary file first so other processes never read a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((key, stored, result), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except (OSError, pickle.PicklingError):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith('.pkl')]
+        if len(entries) > self.disk_maxsize:
+            entries.sort(key=lambda entry: entry.stat().st_mtime)
+            for entry in entries[:len(entries) - self.disk_maxsize]:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+    def get(self, key, compute):
+        """Returns the cached result for key, calling compute() to produce and store it when missing"""
+        key = (self.version, key)
+        with self.lock:
+            entry = self.table.get(key)
+            if entry is not None and not self._expired(entry[0]):
+                self.hits += 1
+                self.table.move_to_end(key)
+                return entry[1]
+
+        entry = self._read_disk(key) if self.directory is not None else None
+        if entry is not None:
+            with self.lock:
+                self.disk_hits += 1
+        else:
+            with self.lock:
+                self.misses += 1
+            entry = (time.time(), compute())
+            if self.directory is not None:
+                self._write_disk(key, *entry)
+
+        with self.lock:
+            self.table[key] = entry
+            self.table.move_to_end(key)
+            while len(self.table) > self.maxsize:
+                self.table.popitem(last=False)  # evict the least recently used result
+        return entry[1]
+
+    def memoize(self, key=None, unordered=()):
+        """Decorator caching a function on its arguments
+
+        Args:
+            key = optional function mapping the arguments to a hashable key, to normalize equivalent inputs;
+                  by default lists become tuples
+            unordered = positions of the list arguments whose order does not matter, such as a multi select
+                        dropdown value; they are sorted (None becomes an empty tuple) for the default key
+        """
+        def normalize(position, arg):
+            if position in unordered:
+                return tuple(sorted(arg or ()))
+            return tuple(arg) if isinstance(arg, list) else arg
+
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args):
+                args_key = key(*args) if key is not None else tuple(
+                    normalize(position, arg) for position, arg in enumerate(args))
+                return self.get((function.__name__, args_key), lambda: function(*args))
+            return wrapper
+        return decorator
+
+    def info(self):
+        """Returns a dictionary of cache hits, disk hits, misses and size"""
+        with self.lock:
+            return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses, 'size': len(self.table),
+                    'maxsize': self.maxsize, 'ttl': self.ttl, 'directory': self.directory, 'version': self.version}
+
+    def clear(self):
+        with self.lock:
+            self.table.clear()
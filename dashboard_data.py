@@ -0,0 +1,327 @@
+"""
+@author: John Bica
+Compact data files for the dashboard
+
+The per topic count model results (data/*topics.csv) repeat every tweet once per number of topics. Here
+they are normalized into one tweet table, with the news source stored as a categorical code and the date
+and year as integers, plus a matrix of the dominant topic of every tweet for each number of topics:
+
+    meta.json           format version, number of topics per row, news source names and usernames
+    id.npy              tweet ids (int64)
+    source.npy          news source code of each tweet (uint8), an index into the source names
+    date.npy            tweet dates (datetime64[D], NaT when unknown)
+    year.npy            tweet years (int16, -1 when unknown)
+    dominant_topic.npy  K x N matrix (int8) of the dominant topic of each tweet, -1 when missing
+
+The topic words and topic names tables are stored next to them as one row per (number of topics, topic),
+see write_topic_data. The bubble chart and topic table of every number of topics are built from those tables
+once and stored ready to serve in payloads.json, see write_payloads.
+
+All arrays are plain .npy files, so the dashboard memory maps them: every gunicorn worker (or, with
+--preload, the master before forking) maps the same files and shares their pages through the page cache.
+"""
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+FORMAT_VERSION = 1
+
+DashboardData = namedtuple('DashboardData', ['num_topics', 'sources', 'usernames', 'id', 'source', 'date',
+                                             'year', 'dominant_topic'])
+TopicCube = namedtuple('TopicCube', ['counts', 'num_topics', 'sources', 'usernames', 'years'])
+
+
+def write_dashboard_data(topic_files, path):
+    """Builds the dashboard data directory from model result files
+
+    Args:
+        topic_files = list of .csv files with the id, date, username, name, num_topics and dominant_topic
+                      of every tweet for one or more numbers of topics
+        path = output directory
+
+    Returns:
+        DashboardData that was written
+    """
+    columns = ['id', 'date', 'username', 'name', 'num_topics', 'dominant_topic']
+    results = pd.concat([pd.read_csv(file, usecols=columns) for file in topic_files], ignore_index=True)
+
+    tweets = results.drop_duplicates(subset='id').reset_index(drop=True)
+    source = pd.Categorical(tweets['name'])
+    if len(source.categories) > np.iinfo(np.uint8).max:
+        raise ValueError('Too many news sources for uint8 codes: {}'.format(len(source.categories)))
+    usernames = tweets.groupby('name')['username'].first().reindex(source.categories)
+    dates = pd.to_datetime(tweets['date'], errors='coerce')
+
+    num_topics = np.sort(results['num_topics'].unique())
+    dominant_topic = np.full((len(num_topics), len(tweets)), -1, dtype=np.int8)
+    dominant_topic[np.searchsorted(num_topics, results['num_topics'].values),
+                   pd.Index(tweets['id']).get_indexer(results['id'])] = results['dominant_topic'].values
+
+    data = DashboardData(num_topics=num_topics.tolist(), sources=source.categories.tolist(),
+                         usernames=usernames.tolist(), id=tweets['id'].values.astype(np.int64),
+                         source=source.codes.astype(np.uint8), date=dates.values.astype('datetime64[D]'),
+                         year=dates.dt.year.fillna(-1).values.astype(np.int16), dominant_topic=dominant_topic)
+
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({'format_version': FORMAT_VERSION, 'num_topics': data.num_topics, 'sources': data.sources,
+                   'usernames': data.usernames}, f, ensure_ascii=False)
+    for name in ('id', 'source', 'date', 'year', 'dominant_topic'):
+        np.save(os.path.join(path, name + '.npy'), getattr(data, name))
+    return data
+
+
+def data_version(path):
+    """Returns a hash of the names, sizes and modification times of the files in a dashboard data directory,
+    which changes whenever merge_sttm_results.py rebuilds it"""
+    entries = sorted((entry.name, entry.stat().st_size, entry.stat().st_mtime_ns) for entry in os.scandir(path)
+                     if entry.is_file())
+    return hashlib.sha1(repr(entries).encode('utf-8')).hexdigest()[:16]
+
+
+def load_dashboard_data(path, mmap=True):
+    """Reads a directory written by write_dashboard_data
+
+    Args:
+        path = dashboard data directory
+        mmap = memory map the arrays read-only instead of reading them into memory
+
+    Returns:
+        DashboardData
+    """
+    with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta['format_version'] > FORMAT_VERSION:
+        raise ValueError('{} has format version {}, newer than the supported version {}'.format(
+            path, meta['format_version'], FORMAT_VERSION))
+    mmap_mode = 'r' if mmap else None
+    arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode)
+              for name in ('id', 'source', 'date', 'year', 'dominant_topic')}
+    return DashboardData(num_topics=meta['num_topics'], sources=meta['sources'], usernames=meta['usernames'],
+                         **arrays)
+
+
+def build_topic_cube(data):
+    """Counts the tweets of every (number of topics, news source, year, dominant topic), so the heat maps
+    are built by slicing and summing the cube
+
+    Args:
+        data = DashboardData
+
+    Returns:
+        TopicCube with the K x sources x years x max(K) counts and the labels of its first three axes
+    """
+    num_topics = np.array(data.num_topics)
+    sources = np.array(data.sources)
+    dated = data.year >= 0
+    years = np.arange(data.year[dated].min(), data.year[dated].max() + 1)
+
+    shape = (len(sources), len(years), int(num_topics.max()))
+    counts = np.zeros((len(num_topics),) + shape, dtype=np.int64)
+    for k in range(len(num_topics)):
+        topics = data.dominant_topic[k]
+        tweets = dated & (topics >= 0)
+        cells = np.ravel_multi_index((data.source[tweets], data.year[tweets] - years[0], topics[tweets]), shape)
+        counts[k] = np.bincount(cells, minlength=np.prod(shape)).reshape(shape)
+    return TopicCube(counts=counts, num_topics=num_topics, sources=sources, usernames=np.array(data.usernames),
+                     years=years)
+
+
+def topic_counts(cube, n_topics, sources, years_range):
+    """Returns the tweet counts per news source and topic and per year and topic of the model with
+    n_topics topics, for the selected sources (names) and the years in years_range
+
+    Args:
+        cube = TopicCube
+        n_topics = number of topics of the model
+        sources = news source names
+        years_range = years
+
+    Returns:
+        data frame of counts indexed by username and data frame of counts indexed by year, with one
+        'Topic <n>' column per topic
+    """
+    counts = cube.counts[np.searchsorted(cube.num_topics, n_topics), :, :, :n_topics]
+    selected_sources, selected_years = np.isin(cube.sources, sources), np.isin(cube.years, years_range)
+    counts = counts[selected_sources][:, selected_years]
+    columns = ['Topic {}'.format(i) for i in range(1, n_topics + 1)]
+
+    user_counts = pd.DataFrame(counts.sum(axis=1), index=pd.Index(cube.usernames[selected_sources], name='username'),
+                               columns=columns)
+    year_counts = pd.DataFrame(counts.sum(axis=0), index=pd.Index(cube.years[selected_years], name='year'),
+                               columns=columns)
+    # like the pivot tables they replace, keep only the sources and years that have tweets
+    user_counts = user_counts[user_counts.sum(axis=1) > 0].sort_index()
+    year_counts = year_counts[year_counts.sum(axis=1) > 0]
+    return user_counts, year_counts
+
+
+# columns of the topic words table holding one list per topic, and their array files
+topic_word_columns = {'top_words': 'topic_top_words', 'doc_count': 'topic_doc_count',
+                      'num_topic_occurence': 'topic_occurrence', 'word_importance': 'topic_word_importance'}
+
+
+def _stack(lists, name):
+    if len(set(len(values) for values in lists)) > 1:
+        raise ValueError('Every topic must have the same number of {}'.format(name))
+    return np.array([list(values) for values in lists])
+
+
+def write_topic_data(topic_words_df, topic_names_df, path):
+    """Writes the topic words and topic names tables as arrays with one row per (number of topics, topic)
+
+    Args:
+        topic_words_df = data frame with num_clusters, topic_num and the lists of topic_word_columns
+        topic_names_df = data frame with num_topics and the dictionaries top_words and topic_names
+        path = output directory
+    """
+    os.makedirs(path, exist_ok=True)
+    arrays = {'topic_words_key': topic_words_df[['num_clusters', 'topic_num']].values.astype(np.int16)}
+    for column, name in topic_word_columns.items():
+        arrays[name] = _stack(topic_words_df[column].tolist(), column)
+
+    keys, names, words = [], [], []
+    for row in topic_names_df.itertuples():
+        for topic, topic_name in sorted(row.topic_names.items()):
+            keys.append((row.num_topics, topic))
+            names.append(topic_name)
+            words.append(row.top_words[topic])
+    arrays['topic_names_key'] = np.array(keys, dtype=np.int16).reshape(-1, 2)
+    arrays['topic_name'] = np.array(names, dtype=str)
+    arrays['topic_name_words'] = _stack([[word for word, _ in pairs] for pairs in words], 'top words')
+    arrays['topic_name_word_counts'] = _stack([[count for _, count in pairs] for pairs in words], 'top words')
+    for name, array in arrays.items():
+        np.save(os.path.join(path, name + '.npy'), array)
+
+
+def load_topic_data(path, mmap=True):
+    """Reads the tables written by write_topic_data
+
+    Args:
+        path = dashboard data directory
+        mmap = memory map the arrays read-only instead of reading them into memory
+
+    Returns:
+        topic words data frame and topic names data frame, as used by the dashboard
+    """
+    mmap_mode = 'r' if mmap else None
+
+    def load(name):
+        return np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode)
+
+    key = load('topic_words_key')
+    topic_words_df = pd.DataFrame({'num_clusters': key[:, 0].astype(np.int64), 'topic_num': key[:, 1].astype(np.int64)})
+    for column, name in topic_word_columns.items():
+        topic_words_df[column] = load(name).tolist()
+
+    key, names = load('topic_names_key'), load('topic_name')
+    words, counts = load('topic_name_words'), load('topic_name_word_counts')
+    rows = []
+    for num_topics in dict.fromkeys(key[:, 0].tolist()):
+        topics = np.flatnonzero(key[:, 0] == num_topics)
+        rows.append({'num_topics': num_topics,
+                     'top_words': {int(key[i, 1]): list(zip(words[i].tolist(), counts[i].tolist())) for i in topics},
+                     'topic_names': {int(key[i, 1]): str(names[i]) for i in topics}})
+    return topic_words_df, pd.DataFrame(rows, columns=['num_topics', 'top_words', 'topic_names'])
+
+
+def bubble_figure(topic_words_df, num_topics, num_words=5):
+    """Builds the bubble chart of the top words of every topic of one model as a plain figure dictionary
+
+    Args:
+        topic_words_df = data frame with num_clusters, topic_num and the lists of topic_word_columns
+        num_topics = number of topics of the model
+        num_words = number of words shown per topic
+
+    Returns:
+        figure dictionary with one scatter trace per topic, only the first topic visible
+    """
+    traces = []
+    topics = topic_words_df[topic_words_df['num_clusters'] == num_topics].sort_values('topic_num')
+    for row in topics.itertuples():
+        occurrences = [int(value) for value in row.num_topic_occurence[:num_words]]
+        words = [str(word) for word in row.top_words[:num_words]]
+        traces.append({
+            'type': 'scatter',
+            'name': str(row.topic_num + 1),
+            'x': [int(value) for value in row.doc_count[:num_words]],
+            'y': [float(value) for value in row.word_importance[:num_words]],
+            'mode': 'markers+text',
+            'opacity': 0.6,
+            'hovertext': words,
+            'hoverlabel': {'font': {'color': '#FFFFFF'}},
+            'marker': {'size': occurrences, 'sizemode': 'area', 'sizeref': 2. * max(occurrences) / (40. ** 2),
+                       'sizemin': 4},
+            'text': words,
+            'textposition': 'bottom center',
+            'visible': True if row.topic_num == 0 else 'legendonly'})  # display the first topic only
+    layout = {
+        'autosize': True,
+        'margin': {'t': 18, 'b': 0, 'l': 10, 'r': 0, 'pad': 0},
+        'xaxis': {'title': {'text': 'Tweet Count'}, 'showgrid': False, 'zeroline': False},
+        'yaxis': {'title': {'text': 'Word Importance'}, 'showgrid': False, 'zeroline': False},
+        'font': {'color': 'white'},
+        'legend': {'itemsizing': 'constant', 'title': {'text': '   Topic #'}},
+        'paper_bgcolor': 'rgba(0,0,0,0)',
+        'plot_bgcolor': 'rgba(0,0,0,0)'}
+    return {'data': traces, 'layout': layout}
+
+
+def topic_table(topic_names_df, num_topics, num_words=5):
+    """Builds the rows, columns and tooltips of the topic descriptions table of one model
+
+    Args:
+        topic_names_df = data frame with num_topics and the dictionaries top_words and topic_names
+        num_topics = number of topics of the model
+        num_words = number of top words shown in the tooltips
+
+    Returns:
+        list of row dictionaries, list of column dictionaries and list of tooltip dictionaries
+    """
+    row = topic_names_df[topic_names_df['num_topics'] == num_topics].iloc[0]
+    topics = sorted(row['topic_names'])
+    data = [{'Topic': int(topic) + 1, 'Description': row['topic_names'][topic]} for topic in topics]  # no 'topic 0'
+    columns = [{'id': c, 'name': c} for c in ('Topic', 'Description')]
+    tooltip_data = [{'Description': 'Top {} words: '.format(num_words) + ', '.join(
+        word for word, _ in row['top_words'][topic][:num_words])} for topic in topics]
+    return data, columns, tooltip_data
+
+
+def build_payloads(topic_words_df, topic_names_df):
+    """Builds the bubble chart and topic table of every number of topics, as served by the dashboard callbacks
+
+    Returns:
+        dictionary mapping each number of topics to a dictionary with the figure, table_data, table_columns,
+        tooltip_data and trace_visibilities
+    """
+    payloads = {}
+    for num_topics in sorted(set(topic_words_df['num_clusters'].tolist()) & set(topic_names_df['num_topics'].tolist())):
+        figure = bubble_figure(topic_words_df, num_topics)
+        data, columns, tooltip_data = topic_table(topic_names_df, num_topics)
+        payloads[int(num_topics)] = {'figure': figure, 'table_data': data, 'table_columns': columns,
+                                     'tooltip_data': tooltip_data,
+                                     'trace_visibilities': [trace['visible'] for trace in figure['data']]}
+    return payloads
+
+
+def write_payloads(topic_words_df, topic_names_df, path):
+    """Writes the payloads of build_payloads to payloads.json in the dashboard data directory"""
+    os.makedirs(path, exist_ok=True)
+    payloads = build_payloads(topic_words_df, topic_names_df)
+    with open(os.path.join(path, 'payloads.json'), 'w', encoding='utf-8') as f:
+        json.dump({'format_version': FORMAT_VERSION, 'payloads': payloads}, f, ensure_ascii=False)
+    return payloads
+
+
+def load_payloads(path):
+    """Reads the payloads written by write_payloads, keyed by number of topics"""
+    with open(os.path.join(path, 'payloads.json'), encoding='utf-8') as f:
+        stored = json.load(f)
+    if stored['format_version'] > FORMAT_VERSION:
+        raise ValueError('{} has format version {}, newer than the supported version {}'.format(
+            path, stored['format_version'], FORMAT_VERSION))
+    return {int(num_topics): payload for num_topics, payload in stored['payloads'].items()}
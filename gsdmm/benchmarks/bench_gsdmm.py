@@ -0,0 +1,152 @@
+'''
+Benchmarks for MovieGroupProcess training and inference on synthetic short text corpora.
+
+Every corpus size runs in a fresh process so its peak resident memory can be read from
+getrusage. Results are written as JSON lines, one per (corpus, stage), tagged with the current
+git commit, so runs from two commits can be compared with --compare.
+
+Usage (from the gsdmm directory):
+    python -m benchmarks.bench_gsdmm --docs 10000 100000 1000000 --output results.jsonl
+    python -m benchmarks.bench_gsdmm --docs 10000 100000 --compare results.jsonl
+'''
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from gsdmm import Corpus, MovieGroupProcess
+
+
+def synthetic_corpus(n_docs, vocab_size=20000, min_length=3, max_length=15, n_topics=20, zipf_a=1.3, seed=0):
+    '''
+    Generate a short text corpus with a topic structure: every document draws its words from one
+    topic, a Zipf distributed window of the vocabulary starting at a topic specific offset
+    :param n_docs: int
+    :param vocab_size: int
+    :param min_length: int: shortest document
+    :param max_length: int: longest document
+    :param n_topics: int
+    :param zipf_a: float: Zipf exponent of the word ranks within a topic
+    :param seed: int
+    :return: list of list of str
+    '''
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(min_length, max_length + 1, size=n_docs)
+    topics = rng.integers(n_topics, size=n_docs)
+    topic_offsets = rng.integers(vocab_size, size=n_topics)
+    ranks = np.minimum(rng.zipf(zipf_a, size=lengths.sum()), vocab_size) - 1
+    words = (np.repeat(topic_offsets[topics], lengths) + ranks) % vocab_size
+
+    vocabulary = ['w%d' % w for w in range(vocab_size)]
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).tolist()
+    return [list(dict.fromkeys(vocabulary[w] for w in words[start:end].tolist()))
+            for start, end in zip(offsets, offsets[1:])]
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20
+
+
+def _timed(stage, n, fn, results, config):
+    start = time.perf_counter()
+    fn()
+    seconds = time.perf_counter() - start
+    results.append(dict(config, stage=stage, seconds=seconds, items=n, items_per_second=n / seconds,
+                        peak_rss_mb=_peak_rss_mb()))
+
+
+def run_case(config):
+    '''
+    Benchmark one corpus configuration in the current process
+    :param config: dict with the synthetic_corpus arguments plus K, n_iters and n_score
+    :return: list of result dicts, one per stage
+    '''
+    results = []
+    corpus_args = {key: config[key] for key in ('n_docs', 'vocab_size', 'min_length', 'max_length', 'seed')}
+    docs = []
+    _timed('generate', config['n_docs'], lambda: docs.extend(synthetic_corpus(**corpus_args)), results, config)
+
+    mgp = MovieGroupProcess(K=config['K'], n_iters=config['n_iters'], random_state=config['seed'])
+    vocab_size = config['vocab_size']
+    _timed('fit', config['n_docs'] * config['n_iters'], lambda: mgp.fit(docs, vocab_size), results, config)
+
+    sample = docs[:config['n_score']]
+    _timed('score', len(sample), lambda: [mgp.score(doc) for doc in sample], results, config)
+    _timed('choose_best_label', len(sample), lambda: [mgp.choose_best_label(doc) for doc in sample], results, config)
+    corpus = Corpus.from_docs(docs)
+    _timed('predict', len(docs), lambda: mgp.predict(corpus), results, config)
+    return results
+
+
+def _commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    '''
+    Print the speed of every (corpus, stage) relative to a previous results file
+    '''
+    def key(result):
+        return (result['n_docs'], result['vocab_size'], result['min_length'], result['max_length'], result['K'],
+                result['stage'])
+
+    with open(baseline_path) as f:
+        baseline = {key(result): result for result in map(json.loads, f)}
+    for result in results:
+        old = baseline.get(key(result))
+        if old is not None:
+            print('%8d docs %-18s %10.0f/s  baseline %10.0f/s  speedup %.2fx' % (
+                result['n_docs'], result['stage'], result['items_per_second'], old['items_per_second'],
+                result['items_per_second'] / old['items_per_second']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark GSDMM training and inference')
+    parser.add_argument('--docs', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--vocab-size', type=int, default=20000)
+    parser.add_argument('--min-length', type=int, default=3)
+    parser.add_argument('--max-length', type=int, default=15)
+    parser.add_argument('--topics', type=int, default=14, help='K of the fitted model')
+    parser.add_argument('--n-iters', type=int, default=3)
+    parser.add_argument('--n-score', type=int, default=1000, help='documents scored one by one')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='append JSON lines to this file instead of stdout')
+    parser.add_argument('--compare', help='JSON lines file of a previous run to compare against')
+    args = parser.parse_args(argv)
+
+    meta = {'commit': _commit(), 'python': platform.python_version(), 'numpy': np.__version__,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    results = []
+    ctx = multiprocessing.get_context('spawn')
+    for n_docs in args.docs:
+        config = dict(meta, n_docs=n_docs, vocab_size=args.vocab_size, min_length=args.min_length,
+                      max_length=args.max_length, K=args.topics, n_iters=args.n_iters, n_score=args.n_score,
+                      seed=args.seed)
+        # a fresh process per corpus size keeps the peak memory of each case separate
+        with ctx.Pool(1) as pool:
+            results.extend(pool.apply(run_case, (config,)))
+
+    lines = '\n'.join(json.dumps(result) for result in results) + '\n'
+    if args.output:
+        with open(args.output, 'a') as f:
+            f.write(lines)
+    else:
+        sys.stdout.write(lines)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -1 +1,2 @@
-from .mgp import MovieGroupProcess
\ No newline at end of file
+from .mgp import MovieGroupProcess
+from .corpus import Corpus
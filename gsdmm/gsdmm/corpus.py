@@ -0,0 +1,127 @@
+import json
+import os
+
+import numpy as np
+
+
+class Corpus:
+    def __init__(self, vocabulary, tokens, offsets):
+        '''
+        An integer encoded corpus of short text documents.
+
+        The token ids of all documents are stored back to back in one flat array and document i
+        spans tokens[offsets[i]:offsets[i + 1]] (the same layout as the rows of a CSR matrix).
+        Encoding the corpus once lets it be saved and shared across every model fit on it.
+
+        :param vocabulary: list[str]
+            The word for each token id
+        :param tokens: numpy array of int32
+            Flat array with the token ids of every document
+        :param offsets: numpy array of int64
+            Array of length D + 1 with the start of each document in tokens
+        '''
+        self.vocabulary = vocabulary
+        self.tokens = tokens
+        self.offsets = offsets
+
+    @staticmethod
+    def from_docs(docs, vocabulary=None):
+        '''
+        Encode tokenized documents
+        :param docs: list of list
+            list of lists containing the tokens of each document
+        :param vocabulary: list[str]
+            Optional existing vocabulary to extend; new words are appended to it
+        :return: Corpus
+        '''
+        vocabulary = list(vocabulary) if vocabulary is not None else []
+        word_index = {word: i for i, word in enumerate(vocabulary)}
+        tokens = []
+        offsets = [0]
+        for doc in docs:
+            for word in doc:
+                if word not in word_index:
+                    word_index[word] = len(vocabulary)
+                    vocabulary.append(word)
+                tokens.append(word_index[word])
+            offsets.append(len(tokens))
+        return Corpus(vocabulary, np.array(tokens, dtype=np.int32), np.array(offsets, dtype=np.int64))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        '''
+        :param i: int: document index
+        :return: numpy array: the token ids of document i
+        '''
+        return self.tokens[self.offsets[i]:self.offsets[i + 1]]
+
+    @property
+    def doc_lengths(self):
+        return np.diff(self.offsets)
+
+    def decode(self, i):
+        '''
+        :param i: int: document index
+        :return: list[str]: the tokens of document i
+        '''
+        return [self.vocabulary[w] for w in self[i]]
+
+    def select(self, indices):
+        '''
+        :param indices: numpy array of document indices, in the order they should appear
+        :return: Corpus: the selected documents, sharing this corpus' vocabulary
+        '''
+        indices = np.asarray(indices, dtype=np.int64)
+        offsets = np.asarray(self.offsets)
+        lengths = offsets[indices + 1] - offsets[indices]
+        new_offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=new_offsets[1:])
+        # position in tokens of every selected token, without a Python loop over the documents
+        positions = np.repeat(offsets[indices] - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+        return Corpus(self.vocabulary, np.asarray(self.tokens)[positions].astype(np.int32), new_offsets)
+
+    def group_identical(self):
+        '''
+        Group the documents that consist of the same tokens, in any order
+        :return: (Corpus of the distinct documents in order of first occurrence,
+                  numpy array: index of the distinct document of every document,
+                  numpy array of int64: number of documents in each group)
+        '''
+        tokens = np.asarray(self.tokens)
+        offsets = self.offsets.tolist()
+        groups = {}
+        inverse = np.empty(len(self), dtype=np.int64)
+        for i, (start, end) in enumerate(zip(offsets, offsets[1:])):
+            inverse[i] = groups.setdefault(np.sort(tokens[start:end]).tobytes(), len(groups))
+        first = np.full(len(groups), len(self), dtype=np.int64)
+        np.minimum.at(first, inverse, np.arange(len(self)))
+        return self.select(first), inverse, np.bincount(inverse, minlength=len(groups)).astype(np.int64)
+
+    def save(self, path):
+        '''
+        Write the corpus to the directory path as .npy arrays plus a JSON vocabulary
+        :param path: str
+        '''
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'tokens.npy'), self.tokens)
+        np.save(os.path.join(path, 'offsets.npy'), self.offsets)
+        with open(os.path.join(path, 'vocabulary.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.vocabulary, f, ensure_ascii=False)
+
+    @staticmethod
+    def load(path, mmap=True):
+        '''
+        Read a corpus written by Corpus.save
+        :param path: str
+        :param mmap: bool
+            Memory map the token and offset arrays instead of reading them into memory
+        :return: Corpus
+        '''
+        mmap_mode = 'r' if mmap else None
+        tokens = np.load(os.path.join(path, 'tokens.npy'), mmap_mode=mmap_mode)
+        offsets = np.load(os.path.join(path, 'offsets.npy'), mmap_mode=mmap_mode)
+        with open(os.path.join(path, 'vocabulary.json'), encoding='utf-8') as f:
+            vocabulary = json.load(f)
+        return Corpus(vocabulary, tokens, offsets)
@@ -0,0 +1,126 @@
+'''
+Near-duplicate collapse of a Corpus with MinHash signatures and locality-sensitive hashing.
+
+Every document is signed with num_perm MinHash values of its set of token ids; the fraction of
+equal values in two signatures estimates the Jaccard similarity of the two token sets. The
+signatures are cut into bands and documents whose rows agree on a whole band land in the same
+bucket, so only documents sharing a bucket are ever compared. Candidates whose estimated
+similarity reaches the threshold are merged with union-find; a document whose chain of merges left
+it less similar than the threshold to the first document of its group is split off again. Each
+group is represented by its first document together with the group size as its weight.
+'''
+import numpy as np
+
+
+
+def _mix(z):
+    # splitmix64 finalizer, in place on an array of uint64 (multiplication wraps modulo 2**64)
+    z ^= z >> np.uint64(30)
+    z *= np.uint64(0xBF58476D1CE4E5B9)
+    z ^= z >> np.uint64(27)
+    z *= np.uint64(0x94D049BB133111EB)
+    z ^= z >> np.uint64(31)
+    return z
+
+
+def minhash_signatures(corpus, num_perm=64, seed=0, batch_size=10000):
+    '''
+    :param corpus: Corpus
+    :param num_perm: int: number of hash functions
+    :param seed: int
+    :param batch_size: int: documents hashed at a time, bounding the temporary memory
+    :return: numpy array of uint64 (D, num_perm); rows of empty documents are all max uint64
+    '''
+    # hash function i is the mix of the token id xor a random salt i
+    salts = np.random.default_rng(seed).integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+    offsets = np.asarray(corpus.offsets)
+    D = len(corpus)
+    signatures = np.full((D, num_perm), np.iinfo(np.uint64).max, dtype=np.uint64)
+    for start in range(0, D, batch_size):
+        end = min(start + batch_size, D)
+        nonempty = np.flatnonzero(np.diff(offsets[start:end + 1])) + start
+        if len(nonempty) == 0:
+            continue
+        ids = np.asarray(corpus.tokens[offsets[start]:offsets[end]], dtype=np.uint64)
+        hashes = _mix(ids[:, None] ^ salts)
+        signatures[nonempty] = np.minimum.reduceat(hashes, offsets[nonempty] - offsets[start], axis=0)
+    return signatures
+
+
+def _find_roots(parent):
+    while True:
+        grandparent = parent[parent]
+        if np.array_equal(grandparent, parent):
+            return parent
+        parent = grandparent
+
+
+def near_duplicate_groups(corpus, threshold=0.8, num_perm=64, bands=16, seed=0):
+    '''
+    Group documents whose token sets have an estimated Jaccard similarity of at least threshold
+    :param corpus: Corpus
+    :param threshold: float: minimum estimated Jaccard similarity of two near-duplicates
+    :param num_perm: int: number of MinHash values per document, a multiple of bands
+    :param bands: int: number of LSH bands; more bands find less similar candidates
+    :param seed: int
+    :return: numpy array: for each document the index of the first document of its group
+    '''
+    if num_perm % bands:
+        raise ValueError('num_perm (%d) must be a multiple of bands (%d)' % (num_perm, bands))
+    signatures = minhash_signatures(corpus, num_perm, seed)
+    rows = num_perm // bands
+    parent = np.arange(len(corpus))
+    docs = np.flatnonzero(np.diff(np.asarray(corpus.offsets)))  # empty documents are never merged
+
+    for band in range(bands):
+        # one 64 bit key per band; colliding keys only add candidates that fail the similarity check
+        key = np.zeros(len(docs), dtype=np.uint64)
+        for column in range(band * rows, (band + 1) * rows):
+            key = _mix(key ^ signatures[docs, column])
+        order = np.argsort(key, kind='stable')
+        sorted_key = key[order]
+        # compare every member of a bucket with the first (lowest index) member
+        is_head = np.r_[True, sorted_key[1:] != sorted_key[:-1]]
+        heads = docs[order][np.maximum.accumulate(np.where(is_head, np.arange(len(order)), 0))]
+        members = docs[order]
+        candidates = heads != members
+        heads, members = heads[candidates], members[candidates]
+        similarity = (signatures[heads] == signatures[members]).mean(axis=1)
+        similar = similarity >= threshold
+        heads, members = heads[similar], members[similar]
+
+        # union the groups of every similar pair, always keeping the lowest index as root
+        while len(heads):
+            parent = _find_roots(parent)
+            root_a, root_b = parent[heads], parent[members]
+            linked = root_a != root_b
+            if not linked.any():
+                break
+            low, high = np.minimum(root_a, root_b)[linked], np.maximum(root_a, root_b)[linked]
+            np.minimum.at(parent, high, low)
+            heads, members = heads[linked], members[linked]
+
+    # chains of similar pairs can link dissimilar documents; those leave their group
+    groups = _find_roots(parent)
+    members = np.flatnonzero(groups != np.arange(len(groups)))
+    similarity = (signatures[members] == signatures[groups[members]]).mean(axis=1)
+    groups[members[similarity < threshold]] = members[similarity < threshold]
+    return groups
+
+
+def collapse_near_duplicates(corpus, threshold=0.8, num_perm=64, bands=16, seed=0):
+    '''
+    Keep one representative document per group of near-duplicates
+    :param corpus: Corpus
+    :param threshold: float: see near_duplicate_groups
+    :param num_perm: int
+    :param bands: int
+    :param seed: int
+    :return: (Corpus of the representatives, numpy array of their indices in corpus,
+              numpy array: row of the representative of every document in the collapsed corpus,
+              numpy array of int64 weights: the number of documents each represents)
+    '''
+    groups = near_duplicate_groups(corpus, threshold, num_perm, bands, seed)
+    representatives, inverse, weights = np.unique(groups, return_inverse=True, return_counts=True)
+    return (corpus.select(representatives), representatives, inverse.reshape(-1).astype(np.int64),
+            weights.astype(np.int64))
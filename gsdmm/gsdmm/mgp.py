@@ -1,10 +1,27 @@
-from numpy.random import multinomial
 from numpy import log, exp
 from numpy import argmax
+import numpy as np
 import json
+import logging
+import math
+import time
+from collections import namedtuple
+
+from .corpus import Corpus
+from .parallel import ShardedSampler, map_batches
+from .sampler import BatchScorer, GibbsSampler, gibbs_sweep
+from .storage import read_arrays, write_arrays
+
+logger = logging.getLogger(__name__)
+
+# metrics of one Gibbs sweep, passed to the fit callback and kept in MovieGroupProcess.history
+IterationStats = namedtuple('IterationStats', ['iteration', 'transfers', 'transfer_rate', 'clusters',
+                                               'log_likelihood', 'seconds', 'docs_per_second'])
+
 
 class MovieGroupProcess:
-    def __init__(self, K=8, alpha=0.1, beta=0.1, n_iters=30):
+    def __init__(self, K=8, alpha=0.1, beta=0.1, n_iters=30, min_transfer_rate=None, tol=None, patience=3,
+                 random_state=None):
         '''
         A MovieGroupProcess is a conceptual model introduced by Yin and Wang 2014 to
         describe their Gibbs sampling algorithm for a Dirichlet Mixture Model for the
@@ -29,18 +46,80 @@ class MovieGroupProcess:
             that students desire to sit with students of similar interests. A high beta means they are less
             concerned with affinity and are more influenced by the popularity of a table
         :param n_iters:
+        :param min_transfer_rate: float
+            Stop early once the fraction of documents that changed cluster in a sweep drops below this
+        :param tol: float
+            Stop early once the relative change of the log-likelihood stays below tol for patience sweeps
+        :param patience: int
+        :param random_state: None, int, numpy.random.SeedSequence or numpy.random.Generator
+            Seed of the generator owned by the model, which draws the initial clusters, every sampling
+            uniform and the seeds of parallel workers
         '''
         self.K = K
         self.alpha = alpha
         self.beta = beta
         self.n_iters = n_iters
+        self.min_transfer_rate = min_transfer_rate
+        self.tol = tol
+        self.patience = patience
+        self.history = []
+        self.random_state = random_state
+        self._rng = np.random.default_rng(random_state)
 
         # slots for computed variables
         self.number_docs = None
         self.vocab_size = None
-        self.cluster_doc_count = [0 for _ in range(K)]
-        self.cluster_word_count = [0 for _ in range(K)]
-        self.cluster_word_distribution = [{} for i in range(K)]
+        self.cluster_doc_count = np.zeros(K, dtype=np.int64)
+        self.cluster_word_count = np.zeros(K, dtype=np.int64)
+
+        # dense K x W word count matrix, columns keyed by the integer ids in word_index
+        self.word_index = {}
+        self.cluster_word_matrix = np.zeros((K, 0), dtype=np.int32)
+        self._cluster_word_distribution = None
+
+    @property
+    def cluster_word_distribution(self):
+        '''
+        Per-cluster word counts as a list of K dicts mapping word -> count. This is a view
+        built from cluster_word_matrix; words with a zero count are omitted.
+        :return: list[dict]
+        '''
+        if self._cluster_word_distribution is None:
+            words = list(self.word_index)
+            distribution = []
+            for row in self.cluster_word_matrix:
+                nonzero = np.flatnonzero(row)
+                distribution.append({words[w]: int(row[w]) for w in nonzero})
+            self._cluster_word_distribution = distribution
+        return self._cluster_word_distribution
+
+    @cluster_word_distribution.setter
+    def cluster_word_distribution(self, distribution):
+        word_index = {}
+        for counts in distribution:
+            for word in counts:
+                if word not in word_index:
+                    word_index[word] = len(word_index)
+        matrix = np.zeros((len(distribution), len(word_index)), dtype=np.int32)
+        for z, counts in enumerate(distribution):
+            for word, count in counts.items():
+                matrix[z, word_index[word]] = count
+        self.word_index = word_index
+        self.cluster_word_matrix = matrix
+        self._cluster_word_distribution = None
+
+    def __setstate__(self, state):
+        # models pickled before the array backed counts hold plain lists and dicts
+        distribution = state.pop('cluster_word_distribution', None)
+        for key, default in (('min_transfer_rate', None), ('tol', None), ('patience', 3), ('history', []),
+                             ('random_state', None)):
+            state.setdefault(key, default)
+        state.setdefault('_rng', np.random.default_rng(state['random_state']))
+        self.__dict__.update(state)
+        if distribution is not None:
+            self.cluster_doc_count = np.asarray(self.cluster_doc_count, dtype=np.int64)
+            self.cluster_word_count = np.asarray(self.cluster_word_count, dtype=np.int64)
+            self.cluster_word_distribution = distribution
 
     @staticmethod
     def from_data(K, alpha, beta, D, vocab_size, cluster_doc_count, cluster_word_count, cluster_word_distribution):
@@ -59,100 +138,216 @@ class MovieGroupProcess:
         mgp = MovieGroupProcess(K, alpha, beta, n_iters=30)
         mgp.number_docs = D
         mgp.vocab_size = vocab_size
-        mgp.cluster_doc_count = cluster_doc_count
-        mgp.cluster_word_count = cluster_word_count
+        mgp.cluster_doc_count = np.asarray(cluster_doc_count, dtype=np.int64)
+        mgp.cluster_word_count = np.asarray(cluster_word_count, dtype=np.int64)
         mgp.cluster_word_distribution = cluster_word_distribution
         return mgp
 
+    def save(self, path):
+        '''
+        Write the fitted model to a single file: a header with K, alpha, beta, D, V and the format
+        version, followed by the cluster counts, the cluster word matrix in sparse (CSR) form and
+        the vocabulary as arrays. See gsdmm.storage for the layout.
+        :param path: str
+        '''
+        rows, indices = np.nonzero(self.cluster_word_matrix)
+        words = [word.encode('utf-8') for word in self.word_index]
+        fields = {'K': self.K, 'alpha': self.alpha, 'beta': self.beta, 'n_iters': self.n_iters,
+                  'D': self.number_docs, 'V': self.vocab_size}
+        write_arrays(path, fields, {
+            'cluster_doc_count': np.asarray(self.cluster_doc_count, dtype=np.int64),
+            'cluster_word_count': np.asarray(self.cluster_word_count, dtype=np.int64),
+            'word_indptr': np.searchsorted(rows, np.arange(self.K + 1)).astype(np.int64),
+            'word_indices': indices.astype(np.int32),
+            'word_counts': self.cluster_word_matrix[rows, indices].astype(np.int32),
+            'vocabulary_offsets': np.cumsum([0] + [len(word) for word in words], dtype=np.int64),
+            'vocabulary': np.frombuffer(b''.join(words), dtype=np.uint8),
+        })
+
     @staticmethod
-    def _sample(p):
+    def load(path, mmap=True):
         '''
-        Sample with probability vector p from a multinomial distribution
-        :param p: list
-            List of probabilities representing probability vector for the multinomial distribution
-        :return: int
-            index of randomly selected output
+        Read a model written by save. Scoring needs the dense K x W cluster word matrix and a word to id
+        dictionary, so both are rebuilt in memory from the sparse matrix and vocabulary arrays on every
+        load; only the cluster count vectors stay memory mapped
+        :param path: str
+        :param mmap: bool
+            Memory map the arrays of the file instead of reading them into memory
+        :return: MovieGroupProcess
         '''
-        return [i for i, entry in enumerate(multinomial(1, p)) if entry != 0][0]
+        fields, arrays = read_arrays(path, mmap)
+        K = fields['K']
+        mgp = MovieGroupProcess(K, fields['alpha'], fields['beta'], n_iters=fields['n_iters'])
+        mgp.number_docs = fields['D']
+        mgp.vocab_size = fields['V']
+        mgp.cluster_doc_count = arrays['cluster_doc_count']
+        mgp.cluster_word_count = arrays['cluster_word_count']
+
+        blob, offsets = arrays['vocabulary'].tobytes(), arrays['vocabulary_offsets'].tolist()
+        mgp.word_index = {blob[start:end].decode('utf-8'): i for i, (start, end) in enumerate(zip(offsets, offsets[1:]))}
+
+        indptr = arrays['word_indptr']
+        matrix = np.zeros((K, len(mgp.word_index)), dtype=np.int32)
+        matrix[np.repeat(np.arange(K), np.diff(indptr)), arrays['word_indices']] = arrays['word_counts']
+        mgp.cluster_word_matrix = matrix
+        return mgp
 
-    def fit(self, docs, vocab_size):
+    def fit(self, docs, vocab_size, n_jobs=1, callback=None, weights=None, group_identical=False):
         '''
         Cluster the input documents
         :param docs: list of list
             list of lists containing the unique token set of each document
         :param V: total vocabulary size for each document
+        :param n_jobs: int
+            number of worker processes, see fit_corpus
+        :param callback: callable, see fit_corpus
+        :param weights: list[int], see fit_corpus
+        :param group_identical: bool, see fit_corpus
         :return: list of length len(doc)
             cluster label for each document
         '''
-        alpha, beta, K, n_iters, V = self.alpha, self.beta, self.K, self.n_iters, vocab_size
-
-        D = len(docs)
-        self.number_docs = D
-        self.vocab_size = vocab_size
+        return self.fit_corpus(Corpus.from_docs(docs), vocab_size, n_jobs=n_jobs, callback=callback,
+                               weights=weights, group_identical=group_identical).tolist()
 
-        # unpack to easy var names
-        m_z, n_z, n_z_w = self.cluster_doc_count, self.cluster_word_count, self.cluster_word_distribution
-        cluster_count = K
-        d_z = [None for i in range(len(docs))]
-
-        # initialize the clusters
-        for i, doc in enumerate(docs):
-
-            # choose a random  initial cluster for the doc
-            z = self._sample([1.0 / K for _ in range(K)])
-            d_z[i] = z
-            m_z[z] += 1
-            n_z[z] += len(doc)
-
-            for word in doc:
-                if word not in n_z_w[z]:
-                    n_z_w[z][word] = 0
-                n_z_w[z][word] += 1
-
-        for _iter in range(n_iters):
-            total_transfers = 0
+    def fit_corpus(self, corpus, vocab_size=None, n_jobs=1, callback=None, weights=None, group_identical=False):
+        '''
+        Cluster an integer encoded corpus
+        :param corpus: Corpus
+            The encoded documents, see Corpus.from_docs
+        :param vocab_size: int
+            total vocabulary size, defaults to the size of the corpus vocabulary
+        :param n_jobs: int
+            number of worker processes. With more than one, the corpus is sharded across the workers
+            and each iteration is an approximate distributed Gibbs sweep, see gsdmm.parallel
+        :param callback: callable
+            called with the IterationStats of every sweep; returning True stops the fit. The stats
+            of all sweeps are also kept in history
+        :param weights: numpy array of int
+            number of copies each document stands for, e.g. the weights of collapsed duplicates
+            (see gsdmm.dedup). A document of weight w is scored once per sweep and its w copies
+            move between clusters together. None gives every document a weight of 1
+        :param group_identical: bool
+            fit on the distinct documents only, weighted by how often each occurs (see
+            Corpus.group_identical); identical documents then always share a label
+        :return: numpy array of length len(corpus)
+            cluster label for each document
+        '''
+        if vocab_size is None:
+            vocab_size = len(corpus.vocabulary)
+        if weights is not None:
+            weights = np.asarray(weights, dtype=np.int64)
+            if weights.shape != (len(corpus),) or (weights < 0).any():
+                raise ValueError('weights must hold one non negative integer per document')
+        if group_identical:
+            distinct, inverse, counts = corpus.group_identical()
+            if weights is not None:
+                counts = np.bincount(inverse, weights=weights, minlength=len(distinct)).astype(np.int64)
+            return self.fit_corpus(distinct, vocab_size, n_jobs=n_jobs, callback=callback, weights=counts)[inverse]
+        alpha, beta, K, V = self.alpha, self.beta, self.K, vocab_size
 
-            for i, doc in enumerate(docs):
+        D = len(corpus)
+        self.number_docs = int(weights.sum()) if weights is not None else D
+        self.vocab_size = vocab_size
 
-                # remove the doc from it's current cluster
-                z_old = d_z[i]
+        self.word_index = {word: i for i, word in enumerate(corpus.vocabulary)}
+        self._cluster_word_distribution = None
 
-                m_z[z_old] -= 1
-                n_z[z_old] -= len(doc)
+        tokens, offsets = corpus.tokens, corpus.offsets.tolist()
+        max_doc_size = int(corpus.doc_lengths.max(initial=0))
+        token_weights = np.repeat(weights, corpus.doc_lengths) if weights is not None else None
+        max_word_count = int(np.bincount(tokens, weights=token_weights).max(initial=0))
 
-                for word in doc:
-                    n_z_w[z_old][word] -= 1
+        # initialize the clusters: choose a random initial cluster for every doc
+        d_z = self._rng.integers(K, size=D)
+        token_clusters = np.repeat(d_z, corpus.doc_lengths)
+        self.cluster_doc_count = np.bincount(d_z, weights=weights, minlength=K).astype(np.int64)
+        self.cluster_word_count = np.bincount(token_clusters, weights=token_weights, minlength=K).astype(np.int64)
+        self.cluster_word_matrix = np.bincount(token_clusters * len(corpus.vocabulary) + tokens,
+                                               weights=token_weights, minlength=K * len(corpus.vocabulary)
+                                               ).reshape(K, -1).astype(np.int32)
 
-                    # compact dictionary to save space
-                    if n_z_w[z_old][word] == 0:
-                        del n_z_w[z_old][word]
+        if n_jobs > 1:
+            seed = int(self._rng.integers(2 ** 63))
+            sharded = ShardedSampler(self, corpus, d_z, n_jobs, seed, max_doc_size, max_word_count, weights)
+            try:
+                self._run_sweeps(sharded.sweep, callback)
+            finally:
+                d_z = sharded.close()
+            return d_z
 
-                # draw sample from distribution to find new cluster
-                p = self.score(doc)
-                z_new = self._sample(p)
+        sampler = GibbsSampler(self.cluster_doc_count, self.cluster_word_count, self.cluster_word_matrix,
+                               alpha, beta, V, self.number_docs, max_doc_size, max_word_count)
+        # all uniforms of a sweep are drawn in one call
+        self._run_sweeps(lambda _iter: gibbs_sweep(sampler, tokens, offsets, d_z, 0, D, self._rng.random(D),
+                                                   weights), callback)
+        return d_z
 
-                # transfer doc to the new cluster
-                if z_new != z_old:
-                    total_transfers += 1
+    def _run_sweeps(self, sweep, callback=None):
+        '''
+        Run up to n_iters Gibbs sweeps, stopping early once the clustering is stable or a stopping
+        rule (min_transfer_rate, tol) or the callback says so
+        :param sweep: callable taking the iteration number and returning the number of transfers
+        :param callback: callable taking the IterationStats of each sweep; returning True stops the fit
+        '''
+        D = self.number_docs
+        self.history = []
+        cluster_count = self.K
+        log_likelihood = None
+        plateau = 0
+        for _iter in range(self.n_iters):
+            start = time.perf_counter()
+            total_transfers = sweep(_iter)
+            seconds = time.perf_counter() - start
 
-                d_z[i] = z_new
-                m_z[z_new] += 1
-                n_z[z_new] += len(doc)
+            cluster_count_new = int(np.count_nonzero(self.cluster_doc_count))
+            log_likelihood_new = self.log_likelihood()
+            stats = IterationStats(_iter, total_transfers, total_transfers / max(D, 1), cluster_count_new,
+                                   log_likelihood_new, seconds, D / seconds if seconds > 0 else float('inf'))
+            self.history.append(stats)
+            logger.info("In stage %d: transferred %d clusters with %d clusters populated, "
+                        "log-likelihood %.2f, %.0f docs/s", _iter, total_transfers, cluster_count_new,
+                        log_likelihood_new, stats.docs_per_second)
 
-                for word in doc:
-                    if word not in n_z_w[z_new]:
-                        n_z_w[z_new][word] = 0
-                    n_z_w[z_new][word] += 1
+            if log_likelihood is not None and abs(log_likelihood_new - log_likelihood) <= \
+                    (self.tol or 0) * abs(log_likelihood):
+                plateau += 1
+            else:
+                plateau = 0
 
-            cluster_count_new = sum([1 for v in m_z if v > 0])
-            print("In stage %d: transferred %d clusters with %d clusters populated" % (
-            _iter, total_transfers, cluster_count_new))
+            if callback is not None and callback(stats):
+                logger.info("Stopped by callback.")
+                break
             if total_transfers == 0 and cluster_count_new == cluster_count and _iter>25:
-                print("Converged.  Breaking out.")
+                logger.info("Converged.  Breaking out.")
+                break
+            if self.min_transfer_rate is not None and stats.transfer_rate < self.min_transfer_rate:
+                logger.info("Transfer rate %.4f below %s.  Breaking out.", stats.transfer_rate, self.min_transfer_rate)
+                break
+            if self.tol is not None and plateau >= self.patience:
+                logger.info("Log-likelihood plateaued for %d stages.  Breaking out.", plateau)
                 break
             cluster_count = cluster_count_new
-        self.cluster_word_distribution = n_z_w
-        return d_z
+            log_likelihood = log_likelihood_new
+
+    def log_likelihood(self):
+        '''
+        Joint log-likelihood log p(d, z | alpha, beta) of the documents and their current cluster
+        assignment under the collapsed Dirichlet Multinomial Mixture model
+        :return: float
+        '''
+        alpha, beta, K, V, D = self.alpha, self.beta, self.K, self.vocab_size, self.number_docs
+        m_z, n_z, n_z_w = self.cluster_doc_count, self.cluster_word_count, self.cluster_word_matrix
+
+        # log p(z): the Dirichlet-multinomial over cluster sizes
+        ll = math.lgamma(K * alpha) - math.lgamma(D + K * alpha)
+        ll += sum(math.lgamma(m + alpha) for m in m_z.tolist()) - K * math.lgamma(alpha)
+        # log p(d | z): per cluster, lgamma(V*beta) - lgamma(n_z + V*beta) plus the word terms
+        ll += K * math.lgamma(V * beta) - sum(math.lgamma(n + V * beta) for n in n_z.tolist())
+        # lgamma(n + beta) - lgamma(beta) = sum(log(beta + j)) for j < n, looked up for every count
+        max_count = int(n_z_w.max(initial=0))
+        log_gamma_ratio = np.concatenate([[0.0], np.cumsum(log(beta + np.arange(max_count)))])
+        ll += log_gamma_ratio[n_z_w].sum()
+        return float(ll)
 
     def score(self, doc):
         '''
@@ -165,10 +360,21 @@ class MovieGroupProcess:
         :return: list[float]: A length K probability vector where each component represents
                               the probability of the document appearing in a particular cluster
         '''
-        alpha, beta, K, V, D = self.alpha, self.beta, self.K, self.vocab_size, self.number_docs
-        m_z, n_z, n_z_w = self.cluster_doc_count, self.cluster_word_count, self.cluster_word_distribution
+        word_index = self.word_index
+        ids = np.array([word_index.get(word, -1) for word in doc], dtype=np.intp)
+        known = ids[ids >= 0]
+        return list(self._score_ids(known, len(ids) - len(known)))
 
-        p = [0 for _ in range(K)]
+    def _score_ids(self, ids, n_unseen):
+        '''
+        Vectorized form of score for a document already mapped to word ids
+        :param ids: numpy array of word ids (columns of cluster_word_matrix)
+        :param n_unseen: int
+            number of additional tokens that have no column, i.e. a count of zero in every cluster
+        :return: numpy array: length K normalized probability vector
+        '''
+        alpha, beta, K, V, D = self.alpha, self.beta, self.K, self.vocab_size, self.number_docs
+        m_z, n_z, n_z_w = self.cluster_doc_count, self.cluster_word_count, self.cluster_word_matrix
 
         #  We break the formula into the following pieces
         #  p = N1*N2/(D1*D2) = exp(lN1 - lD1 + lN2 - lD2)
@@ -176,23 +382,19 @@ class MovieGroupProcess:
         #  lN2 = log(D - 1 + K*alpha)
         #  lN2 = log(product(n_z_w[w] + beta)) = sum(log(n_z_w[w] + beta))
         #  lD2 = log(product(n_z[d] + V*beta + i -1)) = sum(log(n_z[d] + V*beta + i -1))
+        #  each piece is evaluated for all K clusters at once
 
         lD1 = log(D - 1 + K * alpha)
-        doc_size = len(doc)
-        for label in range(K):
-            lN1 = log(m_z[label] + alpha)
-            lN2 = 0
-            lD2 = 0
-            for word in doc:
-                lN2 += log(n_z_w[label].get(word, 0) + beta)
-            for j in range(1, doc_size +1):
-                lD2 += log(n_z[label] + V * beta + j - 1)
-            p[label] = exp(lN1 - lD1 + lN2 - lD2)
+        doc_size = len(ids) + n_unseen
+        lN1 = log(m_z + alpha)
+        lN2 = log(n_z_w[:, ids] + beta).sum(axis=1) + n_unseen * log(beta)
+        lD2 = log(n_z[:, None] + V * beta + np.arange(doc_size)).sum(axis=1)
+        p = exp(lN1 - lD1 + lN2 - lD2)
 
         # normalize the probability vector
-        pnorm = sum(p)
+        pnorm = p.sum()
         pnorm = pnorm if pnorm > 0 else 1
-        return [pp/pnorm for pp in p]
+        return p / pnorm
 
     def choose_best_label(self, doc):
         '''
@@ -202,3 +404,37 @@ class MovieGroupProcess:
         '''
         p = self.score(doc)
         return argmax(p),max(p)
+
+    def predict_proba(self, docs, batch_size=10000, n_jobs=1, group_identical=False):
+        '''
+        Score a whole corpus at once, in vectorized batches
+        :param docs: list of list of str, or Corpus
+            The documents to score
+        :param batch_size: int
+            number of documents scored per array operation
+        :param n_jobs: int
+            number of worker processes scoring batches in parallel
+        :param group_identical: bool
+            score every distinct document only once, see Corpus.group_identical
+        :return: numpy array: len(docs) x K matrix where row i is score(docs[i])
+        '''
+        corpus = docs if isinstance(docs, Corpus) else Corpus.from_docs(docs)
+        if group_identical:
+            distinct, inverse, _ = corpus.group_identical()
+            return self.predict_proba(distinct, batch_size, n_jobs)[inverse]
+        scorer = BatchScorer(self.cluster_doc_count, self.cluster_word_count, self.cluster_word_matrix,
+                             self.word_index, self.alpha, self.beta, self.vocab_size, self.number_docs,
+                             corpus.vocabulary, int(corpus.doc_lengths.max(initial=0)))
+        batches = [(start, min(start + batch_size, len(corpus))) for start in range(0, len(corpus), batch_size)]
+        if n_jobs > 1 and len(batches) > 1:
+            probs = map_batches(scorer, corpus, batches, n_jobs)
+        else:
+            probs = [scorer.proba(corpus, start, end) for start, end in batches]
+        return np.vstack(probs) if probs else np.zeros((0, self.K))
+
+    def predict(self, docs, batch_size=10000, n_jobs=1, group_identical=False):
+        '''
+        Choose the highest probability label for every document, see predict_proba
+        :return: numpy array: the label of each document
+        '''
+        return self.predict_proba(docs, batch_size, n_jobs, group_identical).argmax(axis=1)
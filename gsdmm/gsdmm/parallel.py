@@ -0,0 +1,151 @@
+'''
+Approximate distributed Gibbs sampling (AD-Gibbs, Newman et al. 2009) for a single GSDMM fit.
+
+The corpus is split into one contiguous shard per worker process. In every iteration each worker
+copies a snapshot of the global cluster counts, sweeps its own shard against that snapshot with a
+generator seeded from (seed, iteration, shard), and writes the new labels of its shard in place.
+The count deltas of all moved documents are then merged into the global counts before the next
+iteration. Counts and labels live in shared memory, so only task tuples travel between processes.
+
+Batch inference (MovieGroupProcess.predict_proba) can likewise score batches of documents in a
+pool, see map_batches.
+'''
+import multiprocessing
+
+import numpy as np
+
+from .sampler import GibbsSampler, gibbs_sweep
+
+# state of the current worker process, see _init_worker
+_worker = {}
+
+
+def _shared(raw, dtype, shape):
+    return np.frombuffer(raw, dtype=dtype).reshape(shape)
+
+
+def _init_worker(tokens, offsets, weights, raws, K, W, params):
+    _worker['tokens'] = tokens
+    _worker['weights'] = weights
+    _worker['offsets'] = offsets.tolist()
+    _worker['m_z'] = _shared(raws[0], np.int64, K)
+    _worker['n_z'] = _shared(raws[1], np.int64, K)
+    _worker['n_z_w'] = _shared(raws[2], np.int32, (K, W))
+    _worker['d_z'] = _shared(raws[3], np.int64, -1)
+    _worker['params'] = params
+
+
+def _sweep_shard(task):
+    shard, start, end, seed, _iter = task
+    alpha, beta, V, D, max_doc_size, max_word_count = _worker['params']
+    sampler = GibbsSampler(_worker['m_z'].copy(), _worker['n_z'].copy(), _worker['n_z_w'].copy(),
+                           alpha, beta, V, D, max_doc_size, max_word_count)
+    uniforms = np.random.default_rng([seed, _iter, shard]).random(end - start)
+    return gibbs_sweep(sampler, _worker['tokens'], _worker['offsets'], _worker['d_z'], start, end, uniforms,
+                       _worker['weights'])
+
+
+class ShardedSampler:
+    def __init__(self, mgp, corpus, d_z, n_jobs, seed, max_doc_size, max_word_count, weights=None):
+        '''
+        Run the Gibbs sweeps of one fit across a pool of worker processes.
+
+        The count arrays of mgp and the label vector are replaced by views on shared memory
+        for the lifetime of the sampler; close() copies them back into private arrays.
+
+        :param mgp: MovieGroupProcess being fit, with its counts initialized for d_z
+        :param corpus: Corpus
+        :param d_z: numpy array: initial cluster label of each document
+        :param n_jobs: int: number of worker processes and shards
+        :param seed: int: base seed of every shard generator
+        :param max_doc_size: int
+        :param max_word_count: int
+        :param weights: numpy array: integer weight of every document, None for all ones
+        '''
+        K, D, W = mgp.K, len(corpus), len(corpus.vocabulary)
+        self.mgp = mgp
+        self.seed = seed
+        self.K, self.W = K, W
+        self.tokens = np.asarray(corpus.tokens)
+        self.doc_lengths = corpus.doc_lengths
+        self.doc_of_token = np.repeat(np.arange(D), self.doc_lengths)
+        self.weights = weights
+
+        ctx = multiprocessing.get_context()
+        raws = (ctx.RawArray('q', K), ctx.RawArray('q', K), ctx.RawArray('i', K * W), ctx.RawArray('q', max(D, 1)))
+        for name, raw in zip(('cluster_doc_count', 'cluster_word_count', 'cluster_word_matrix'), raws):
+            array = getattr(mgp, name)
+            shared = _shared(raw, array.dtype, array.shape)
+            shared[:] = array
+            setattr(mgp, name, shared)
+        self.d_z = _shared(raws[3], np.int64, -1)[:D]
+        self.d_z[:] = d_z
+
+        bounds = np.linspace(0, D, n_jobs + 1).astype(int)
+        self.shards = [(shard, int(bounds[shard]), int(bounds[shard + 1])) for shard in range(n_jobs)]
+        params = (mgp.alpha, mgp.beta, mgp.vocab_size, mgp.number_docs, max_doc_size, max_word_count)
+        self.pool = ctx.Pool(n_jobs, initializer=_init_worker,
+                             initargs=(corpus.tokens, corpus.offsets, weights, raws, K, W, params))
+
+    def sweep(self, _iter):
+        '''
+        Run one parallel sweep over all shards and merge the count deltas
+        :param _iter: int: iteration number, part of every shard seed
+        :return: int: number of documents that changed cluster
+        '''
+        K, W, mgp = self.K, self.W, self.mgp
+        d_z_old = self.d_z.copy()
+        tasks = [(shard, start, end, self.seed, _iter) for shard, start, end in self.shards]
+        total_transfers = sum(self.pool.map(_sweep_shard, tasks))
+
+        moved = d_z_old != self.d_z
+        z_old, z_new = d_z_old[moved], self.d_z[moved]
+        doc_weights = self.weights[moved] if self.weights is not None else None
+        lengths = self.doc_lengths[moved] * (doc_weights if doc_weights is not None else 1)
+        mgp.cluster_doc_count += (np.bincount(z_new, weights=doc_weights, minlength=K) -
+                                  np.bincount(z_old, weights=doc_weights, minlength=K)).astype(np.int64)
+        mgp.cluster_word_count += (np.bincount(z_new, weights=lengths, minlength=K) -
+                                   np.bincount(z_old, weights=lengths, minlength=K)).astype(np.int64)
+
+        moved_tokens = moved[self.doc_of_token]
+        token_docs, ids = self.doc_of_token[moved_tokens], self.tokens[moved_tokens]
+        token_weights = self.weights[token_docs] if self.weights is not None else None
+        delta = (np.bincount(self.d_z[token_docs] * W + ids, weights=token_weights, minlength=K * W) -
+                 np.bincount(d_z_old[token_docs] * W + ids, weights=token_weights, minlength=K * W))
+        mgp.cluster_word_matrix += delta.reshape(K, W).astype(np.int32)
+        return total_transfers
+
+    def close(self):
+        '''
+        Stop the workers and move the counts and labels out of shared memory
+        :return: numpy array: cluster label for each document
+        '''
+        self.pool.close()
+        self.pool.join()
+        mgp = self.mgp
+        mgp.cluster_doc_count = mgp.cluster_doc_count.copy()
+        mgp.cluster_word_count = mgp.cluster_word_count.copy()
+        mgp.cluster_word_matrix = mgp.cluster_word_matrix.copy()
+        return self.d_z.copy()
+
+
+def _init_scorer(scorer, corpus):
+    _worker['scorer'] = scorer
+    _worker['corpus'] = corpus
+
+
+def _score_batch(bounds):
+    return _worker['scorer'].proba(_worker['corpus'], *bounds)
+
+
+def map_batches(scorer, corpus, batches, n_jobs):
+    '''
+    Score batches of documents in a pool of worker processes
+    :param scorer: BatchScorer
+    :param corpus: Corpus
+    :param batches: list of (start, end) document ranges
+    :param n_jobs: int: number of worker processes
+    :return: list of probability matrices, one per batch
+    '''
+    with multiprocessing.get_context().Pool(n_jobs, initializer=_init_scorer, initargs=(scorer, corpus)) as pool:
+        return pool.map(_score_batch, batches)
@@ -0,0 +1,167 @@
+from numpy import log, exp
+import numpy as np
+import math
+
+
+class GibbsSampler:
+    def __init__(self, m_z, n_z, n_z_w, alpha, beta, V, D, max_doc_size, max_word_count):
+        '''
+        Incremental state of the collapsed Gibbs sampler over the cluster count arrays of a GSDMM.
+
+        Scoring a document against formula (3) needs log(m_z + alpha), log(n_z_w + beta) for each
+        word and the denominator sum(log(n_z + V*beta + j - 1)) for j up to the document length.
+        These are kept in tables that are only refreshed for the two clusters touched when a
+        document moves, so scoring a document reduces to lookups and a few subtractions.
+
+        :param m_z: numpy array: documents per cluster, updated in place
+        :param n_z: numpy array: words per cluster, updated in place
+        :param n_z_w: numpy array: K x W cluster word matrix, updated in place
+        :param alpha: float
+        :param beta: float
+        :param V: int: vocabulary size
+        :param D: int: number of documents
+        :param max_doc_size: int
+            Length of the longest document that will be scored
+        :param max_word_count: int
+            Upper bound on any entry of the cluster word matrix
+        '''
+        K = len(m_z)
+        self.m_z, self.n_z, self.n_z_w = m_z, n_z, n_z_w
+        self.alpha = alpha
+        self.V_beta = V * beta
+        self.lD1 = log(D - 1 + K * alpha)
+        self._steps = np.arange(max_doc_size)
+
+        # log(n + beta) for every possible word count n
+        self.log_word_count = log(np.arange(max_word_count + 1) + beta)
+        # lN1 per cluster and the cumulative lD2 per cluster and document length
+        self.lN1 = log(self.m_z + self.alpha)
+        self.lD2 = np.zeros((K, max_doc_size + 1))
+        for z in range(K):
+            self._refresh(z)
+
+    def _refresh(self, z):
+        self.lN1[z] = math.log(self.m_z[z] + self.alpha)
+        log(self.n_z[z] + self.V_beta + self._steps).cumsum(out=self.lD2[z, 1:])
+
+    def add(self, z, ids, weight=1):
+        self.m_z[z] += weight
+        self.n_z[z] += weight * len(ids)
+        np.add.at(self.n_z_w[z], ids, weight)
+        self._refresh(z)
+
+    def remove(self, z, ids, weight=1):
+        self.m_z[z] -= weight
+        self.n_z[z] -= weight * len(ids)
+        np.subtract.at(self.n_z_w[z], ids, weight)
+        self._refresh(z)
+
+    def score(self, ids):
+        '''
+        :param ids: numpy array of word ids
+        :return: numpy array: length K normalized probability vector, as MovieGroupProcess.score
+        '''
+        lN2 = self.log_word_count[self.n_z_w[:, ids]].sum(axis=1)
+        p = exp(self.lN1 - self.lD1 + lN2 - self.lD2[:, len(ids)])
+        pnorm = p.sum()
+        pnorm = pnorm if pnorm > 0 else 1
+        return p / pnorm
+
+
+def sample_categorical(p, u):
+    '''
+    Draw an index with probability proportional to p by inverting the cumulative sum at u
+    :param p: numpy array: non negative weights
+    :param u: float: a uniform draw from [0, 1)
+    :return: int
+    '''
+    cdf = p.cumsum()
+    return min(int(cdf.searchsorted(u * cdf[-1], side='right')), len(p) - 1)
+
+
+def gibbs_sweep(sampler, tokens, offsets, d_z, start, end, uniforms, weights=None):
+    '''
+    Reassign documents start..end-1 once, in order. A document of weight w stands for w identical
+    copies: it is scored once and all of its copies move between clusters together
+    :param sampler: GibbsSampler
+    :param tokens: numpy array: flat token ids of the corpus
+    :param offsets: list[int]: document offsets into tokens
+    :param d_z: numpy array: cluster label of each document, updated in place
+    :param start: int
+    :param end: int
+    :param uniforms: numpy array: end - start uniform draws from [0, 1), one per document
+    :param weights: numpy array: integer weight of every document of the corpus, None for all ones
+    :return: int: number of documents (counted with their weights) that changed cluster
+    '''
+    total_transfers = 0
+    weights = weights[start:end].tolist() if weights is not None else [1] * (end - start)
+    for i, u, weight in zip(range(start, end), uniforms.tolist(), weights):
+        ids = tokens[offsets[i]:offsets[i + 1]]
+
+        # remove the doc from it's current cluster
+        z_old = d_z[i]
+        sampler.remove(z_old, ids, weight)
+
+        # draw sample from distribution to find new cluster
+        p = sampler.score(ids)
+        z_new = sample_categorical(p, u)
+
+        # transfer doc to the new cluster
+        if z_new != z_old:
+            total_transfers += weight
+
+        d_z[i] = z_new
+        sampler.add(z_new, ids, weight)
+    return total_transfers
+
+
+class BatchScorer:
+    def __init__(self, m_z, n_z, n_z_w, word_index, alpha, beta, V, D, vocabulary, max_doc_size):
+        '''
+        Score many documents of an encoded corpus at once with formula (3).
+
+        The log terms are tabulated once for the current cluster counts, with one extra column of
+        log(beta) for corpus words the model has never seen and a column of zeros for padding, so a
+        batch of documents is scored with a gather over its tokens, a segmented sum and a lookup of
+        the lD2 term by document length.
+
+        :param m_z: numpy array: documents per cluster
+        :param n_z: numpy array: words per cluster
+        :param n_z_w: numpy array: K x W cluster word matrix
+        :param word_index: dict: word -> column of n_z_w
+        :param alpha: float
+        :param beta: float
+        :param V: int: vocabulary size
+        :param D: int: number of documents the model was fit on
+        :param vocabulary: list[str]: vocabulary of the corpus that will be scored
+        :param max_doc_size: int: length of the longest document that will be scored
+        '''
+        K, W = n_z_w.shape
+        self.columns = np.array([word_index.get(word, W) for word in vocabulary], dtype=np.intp)
+        self.log_word = np.hstack([log(n_z_w + beta), np.full((K, 1), log(beta)), np.zeros((K, 1))])
+        self.log_prior = log(m_z + alpha) - log(D - 1 + K * alpha)
+        lD2 = np.zeros((K, max_doc_size + 1))
+        np.cumsum(log(n_z[:, None] + V * beta + np.arange(max_doc_size)), axis=1, out=lD2[:, 1:])
+        self.lD2 = lD2
+
+    def proba(self, corpus, start, end):
+        '''
+        :param corpus: Corpus
+        :param start: int: first document of the batch
+        :param end: int: end of the batch (exclusive)
+        :return: numpy array: (end - start) x K matrix of normalized probability vectors
+        '''
+        offsets = np.asarray(corpus.offsets[start:end + 1])
+        lengths = np.diff(offsets)
+        # sum the word terms of each document; the padding column keeps every start index in
+        # range for reduceat, whose result for an empty document is then reset to zero
+        columns = np.append(self.columns[corpus.tokens[offsets[0]:offsets[-1]]], -1)
+        word_logs = self.log_word[:, columns]
+        lN2 = np.add.reduceat(word_logs, offsets[:-1] - offsets[0], axis=1)
+        lN2[:, lengths == 0] = 0
+        p = exp(self.log_prior[:, None] + lN2 - self.lD2[:, lengths])
+
+        # normalize each probability vector
+        pnorm = p.sum(axis=0)
+        pnorm[pnorm == 0] = 1
+        return (p / pnorm).T
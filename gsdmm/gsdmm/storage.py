@@ -0,0 +1,77 @@
+'''
+Container format for fitted models: a small JSON header followed by raw NumPy arrays.
+
+Layout of a file:
+    MAGIC (8 bytes) | header length (uint32, little endian) | header (UTF-8 JSON) | arrays
+
+The header holds the format version, the scalar model fields and, for every array, its dtype,
+shape and byte offset. Arrays start on ALIGNMENT byte boundaries so they can be memory mapped
+directly from the file.
+'''
+import json
+import struct
+
+import numpy as np
+
+MAGIC = b'\x93GSDMM\x00\x00'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+
+def _align(n):
+    return (n + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_arrays(path, fields, arrays):
+    '''
+    :param path: str
+    :param fields: dict: JSON serializable scalar fields
+    :param arrays: dict: name -> numpy array
+    '''
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+
+    # the header stores offsets relative to the end of the header, which depend on nothing else
+    specs = {}
+    offset = 0
+    for name, array in arrays.items():
+        specs[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = _align(offset + array.nbytes)
+    header = json.dumps({'format_version': FORMAT_VERSION, 'fields': fields, 'arrays': specs}).encode('utf-8')
+    data_start = _align(len(MAGIC) + 4 + len(header))
+
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(data_start + specs[name]['offset'])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+
+
+def read_arrays(path, mmap=True):
+    '''
+    :param path: str
+    :param mmap: bool: memory map the arrays read-only instead of reading them into memory
+    :return: (dict of fields, dict of arrays)
+    '''
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('%s is not a GSDMM model file' % path)
+        header_size, = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(header_size).decode('utf-8'))
+        if header['format_version'] > FORMAT_VERSION:
+            raise ValueError('%s has format version %d, newer than the supported version %d' % (
+                path, header['format_version'], FORMAT_VERSION))
+        data_start = _align(len(MAGIC) + 4 + header_size)
+
+        arrays = {}
+        for name, spec in header['arrays'].items():
+            dtype, shape = np.dtype(spec['dtype']), tuple(spec['shape'])
+            offset = data_start + spec['offset']
+            if mmap and np.prod(shape) > 0:
+                arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape)
+            else:
+                f.seek(offset)
+                arrays[name] = np.fromfile(f, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+    return header['fields'], arrays
@@ -0,0 +1,120 @@
+'''
+Fit one MovieGroupProcess per combination of topic count, alpha, beta and seed in a process pool.
+
+The corpus is encoded once and saved as a Corpus directory; every worker memory maps the same
+files, so the token arrays are shared through the page cache instead of being copied per process.
+Each fit writes <name>.gsdmm (see MovieGroupProcess.save) and <name>_labels.npy to the output
+directory, where <name> is e.g. 10clusters, or 10clusters_alpha0.1_beta0.05_seed2 when several
+settings are swept.
+
+Usage:
+    python -m gsdmm.sweep input/english_health_tweets.csv --topics 4 5 6 7 8 9 10 11 12 13 14 \
+        --output dumps/trained_models
+'''
+import argparse
+import csv
+import itertools
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .corpus import Corpus
+from .mgp import MovieGroupProcess
+
+# corpus shared by the tasks of one worker process, see _init_worker
+_corpus = None
+
+
+def read_corpus(path, column='clean_tweet'):
+    '''
+    Load a saved Corpus directory, or encode a CSV whose column holds whitespace separated tokens
+    :param path: str
+    :param column: str: name of the token column when path is a CSV file
+    :return: Corpus
+    '''
+    if os.path.isdir(path):
+        return Corpus.load(path)
+    csv.field_size_limit(sys.maxsize)
+    with open(path, newline='', encoding='utf-8') as f:
+        return Corpus.from_docs(row[column].split() for row in csv.DictReader(f))
+
+
+def model_name(K, alpha, beta, seed, swept=()):
+    '''
+    :return: str: file name stem for a fit, naming only the swept settings besides K
+    '''
+    name = '%dclusters' % K
+    for key, value in (('alpha', alpha), ('beta', beta), ('seed', seed)):
+        if key in swept:
+            name += '_%s%s' % (key, value)
+    return name
+
+
+def _init_worker(corpus_path):
+    global _corpus
+    _corpus = Corpus.load(corpus_path, mmap=True)
+
+
+def _fit_one(task):
+    K, alpha, beta, seed, n_iters, output_dir, name = task
+    mgp = MovieGroupProcess(K=K, alpha=alpha, beta=beta, n_iters=n_iters, random_state=seed)
+    labels = mgp.fit_corpus(_corpus)
+
+    mgp.save(os.path.join(output_dir, name + '.gsdmm'))
+    np.save(os.path.join(output_dir, name + '_labels.npy'), labels)
+    return name, int(np.count_nonzero(mgp.cluster_doc_count))
+
+
+def run_sweep(corpus_path, topics, alphas=(0.1,), betas=(0.1,), seeds=(0,), n_iters=30,
+              output_dir='.', workers=None):
+    '''
+    Fit every combination of the given settings in a process pool
+    :param corpus_path: str: a Corpus directory shared by all workers
+    :param topics: list[int]: values of K
+    :param alphas: list[float]
+    :param betas: list[float]
+    :param seeds: list[int]
+    :param n_iters: int
+    :param output_dir: str
+    :param workers: int: number of processes, defaults to the number of CPUs
+    :return: list of (name, populated clusters) in task order
+    '''
+    os.makedirs(output_dir, exist_ok=True)
+    swept = {key for key, values in (('alpha', alphas), ('beta', betas), ('seed', seeds)) if len(values) > 1}
+    tasks = [(K, alpha, beta, seed, n_iters, output_dir, model_name(K, alpha, beta, seed, swept))
+             for K, alpha, beta, seed in itertools.product(topics, alphas, betas, seeds)]
+    workers = min(workers or os.cpu_count(), len(tasks))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(corpus_path,)) as pool:
+        return list(pool.map(_fit_one, tasks))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fit GSDMM models for several topic counts in parallel')
+    parser.add_argument('corpus', help='Corpus directory or CSV file of cleaned tweets')
+    parser.add_argument('--column', default='clean_tweet', help='token column of the CSV input')
+    parser.add_argument('--topics', type=int, nargs='+', default=list(range(4, 15)))
+    parser.add_argument('--alpha', type=float, nargs='+', default=[0.1])
+    parser.add_argument('--beta', type=float, nargs='+', default=[0.1])
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0])
+    parser.add_argument('--n-iters', type=int, default=30)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', default='dumps/trained_models')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(processName)s %(message)s')
+
+    corpus_path = args.corpus
+    if not os.path.isdir(corpus_path):
+        corpus_path = os.path.join(args.output, 'corpus')
+        read_corpus(args.corpus, args.column).save(corpus_path)
+
+    results = run_sweep(corpus_path, args.topics, args.alpha, args.beta, args.seeds, args.n_iters,
+                        args.output, args.workers)
+    for name, populated in results:
+        print('%s: %d clusters populated' % (name, populated))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+from unittest import TestCase
+from gsdmm.corpus import Corpus
+from gsdmm.mgp import MovieGroupProcess
+import numpy
+import tempfile
+
+
+class TestCorpus(TestCase):
+    '''This class tests the integer encoded corpus'''
+
+    def setUp(self):
+        self.texts = [text.split() for text in [
+            "red dog lives in the house",
+            "blue cat eats mice",
+            "green cat eats mice",
+            "",
+            "monkeys eat banana",
+        ]]
+
+    def test_encode(self):
+        corpus = Corpus.from_docs(self.texts)
+        self.assertEqual(len(corpus), len(self.texts))
+        self.assertEqual(corpus.tokens.dtype, numpy.int32)
+        self.assertEqual(len(corpus.vocabulary), len(set(w for text in self.texts for w in text)))
+        self.assertEqual(corpus.doc_lengths.tolist(), [len(text) for text in self.texts])
+        for i, text in enumerate(self.texts):
+            self.assertEqual(corpus.decode(i), text)
+
+    def test_group_identical(self):
+        corpus = Corpus.from_docs(self.texts + [["mice", "eats", "cat", "blue"], [], ["monkeys", "eat"]])
+        distinct, inverse, counts = corpus.group_identical()
+        self.assertEqual(inverse.tolist(), [0, 1, 2, 3, 4, 1, 3, 5])
+        self.assertEqual(counts.tolist(), [1, 2, 1, 2, 1, 1])
+        for i, doc in enumerate([0, 1, 2, 3, 4, 7]):
+            self.assertEqual(distinct.decode(i), corpus.decode(doc))
+        self.assertEqual(corpus.select([4, 0]).decode(0), self.texts[4])
+
+    def test_save_load(self):
+        corpus = Corpus.from_docs(self.texts)
+        with tempfile.TemporaryDirectory() as path:
+            corpus.save(path)
+            loaded = Corpus.load(path)
+            self.assertIsInstance(loaded.tokens, numpy.memmap)
+            self.assertEqual(loaded.vocabulary, corpus.vocabulary)
+            numpy.testing.assert_array_equal(loaded.tokens, corpus.tokens)
+            numpy.testing.assert_array_equal(loaded.offsets, corpus.offsets)
+            del loaded
+
+    def test_fit_corpus(self):
+        corpus = Corpus.from_docs(self.texts)
+        y = MovieGroupProcess(K=5, n_iters=10, random_state=3).fit(self.texts, len(corpus.vocabulary))
+        mgp = MovieGroupProcess(K=5, n_iters=10, random_state=3)
+        labels = mgp.fit_corpus(corpus)
+        self.assertEqual(labels.tolist(), y)
+        self.assertEqual(mgp.cluster_doc_count.sum(), len(self.texts))
+
+    def test_fit_weighted(self):
+        corpus = Corpus.from_docs(self.texts * 3)
+        mgp = MovieGroupProcess(K=5, n_iters=10, random_state=3)
+        labels = mgp.fit_corpus(corpus, group_identical=True)
+        self.assertEqual(labels.reshape(3, -1).tolist(), [labels[:len(self.texts)].tolist()] * 3)
+        self.assertEqual(mgp.number_docs, len(corpus))
+        self.assertEqual(mgp.cluster_doc_count.sum(), len(corpus))
+        self.assertEqual(mgp.cluster_word_count.sum(), len(corpus.tokens))
+        numpy.testing.assert_allclose(mgp.predict_proba(corpus, group_identical=True), mgp.predict_proba(corpus))
+
+        weighted = MovieGroupProcess(K=5, n_iters=10, random_state=3)
+        weighted.fit(self.texts, len(corpus.vocabulary), weights=[3] * len(self.texts))
+        numpy.testing.assert_array_equal(weighted.cluster_doc_count, mgp.cluster_doc_count)
+        numpy.testing.assert_array_equal(weighted.cluster_word_matrix, mgp.cluster_word_matrix)
+        with self.assertRaises(ValueError):
+            weighted.fit(self.texts, len(corpus.vocabulary), weights=[1, 2])
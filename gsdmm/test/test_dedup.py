@@ -0,0 +1,54 @@
+from unittest import TestCase
+from gsdmm.corpus import Corpus
+from gsdmm.dedup import minhash_signatures, near_duplicate_groups, collapse_near_duplicates
+import numpy
+
+
+class TestDedup(TestCase):
+    '''This class tests the MinHash near-duplicate collapse'''
+
+    def setUp(self):
+        self.texts = [text.split() for text in [
+            "cdc warns flu season could start early this year",
+            "cdc warns flu season could start early this year video",
+            "",
+            "new study links coffee to better heart health",
+            "",
+            "monkeys eat banana",
+            "new study links coffee to better heart health in women",
+            "cdc warns flu season could start early this year",
+        ]]
+        self.corpus = Corpus.from_docs(self.texts)
+
+    def test_signatures_estimate_jaccard(self):
+        signatures = minhash_signatures(self.corpus, num_perm=256)
+        self.assertEqual(signatures.shape, (len(self.texts), 256))
+        numpy.testing.assert_array_equal(signatures[0], signatures[7])
+        for i, j in [(0, 1), (3, 6), (0, 3)]:
+            a, b = set(self.texts[i]), set(self.texts[j])
+            estimate = (signatures[i] == signatures[j]).mean()
+            self.assertAlmostEqual(estimate, len(a & b) / len(a | b), delta=0.15)
+
+    def test_groups(self):
+        groups = near_duplicate_groups(self.corpus, threshold=0.7)
+        self.assertEqual(groups.tolist(), [0, 0, 2, 3, 4, 5, 3, 0])
+        groups = near_duplicate_groups(self.corpus, threshold=1.0)
+        self.assertEqual(groups.tolist(), [0, 1, 2, 3, 4, 5, 6, 0])
+
+    def test_collapse(self):
+        collapsed, representatives, groups, weights = collapse_near_duplicates(self.corpus, threshold=0.7)
+        self.assertEqual(representatives.tolist(), [0, 2, 3, 4, 5])
+        self.assertEqual(groups.tolist(), [0, 0, 1, 2, 3, 4, 2, 0])
+        self.assertEqual(weights.tolist(), [3, 1, 2, 1, 1])
+        self.assertEqual(weights.sum(), len(self.texts))
+        for i, doc in enumerate(representatives):
+            self.assertEqual(collapsed.decode(i), self.texts[doc])
+
+    def test_expand_labels(self):
+        collapsed, representatives, groups, weights = collapse_near_duplicates(self.corpus, threshold=0.7)
+        labels = numpy.arange(len(collapsed)) * 10  # one label per representative
+        expanded = labels[groups]
+        self.assertEqual(len(expanded), len(self.texts))
+        self.assertEqual(numpy.bincount(groups).tolist(), weights.tolist())
+        for doc, label in enumerate(expanded):
+            self.assertEqual(collapsed.decode(label // 10), self.texts[representatives[groups[doc]]])
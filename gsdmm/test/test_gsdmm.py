@@ -1,16 +1,13 @@
 from unittest import TestCase
+from gsdmm.corpus import Corpus
 from gsdmm.mgp import MovieGroupProcess
+from gsdmm.sampler import GibbsSampler, sample_categorical
 import numpy
+import math
 
 class TestGSDMM(TestCase):
     '''This class tests the Panel data structures needed to support the RSK model'''
 
-    def setUp(self):
-        numpy.random.seed(47)
-
-    def tearDown(self):
-        numpy.random.seed(None)
-
     def compute_V(self, texts):
         V = set()
         for text in texts:
@@ -47,7 +44,7 @@ class TestGSDMM(TestCase):
         ]))
 
         grades = grades + grades + grades + grades + grades
-        mgp = MovieGroupProcess(K=100, n_iters=100, alpha=0.001, beta=0.01)
+        mgp = MovieGroupProcess(K=100, n_iters=100, alpha=0.001, beta=0.01, random_state=13)
         y = mgp.fit(grades, self.compute_V(grades))
         self.assertEqual(len(set(y)), 7)
         for words in mgp.cluster_word_distribution:
@@ -73,7 +70,122 @@ class TestGSDMM(TestCase):
 
         texts = [text.split() for text in texts]
         V = self.compute_V(texts)
-        mgp = MovieGroupProcess(K=30, n_iters=100, alpha=0.2, beta=0.01)
+        mgp = MovieGroupProcess(K=30, n_iters=100, alpha=0.2, beta=0.01, random_state=47)
         y = mgp.fit(texts, V)
         self.assertTrue(len(set(y))<10)
-        self.assertTrue(len(set(y))>3)
\ No newline at end of file
+        self.assertTrue(len(set(y))>3)
+
+    def test_score_matches_formula(self):
+        texts = [
+            "where the red dog lives",
+            "red dog lives in the house",
+            "blue cat eats mice",
+            "green cat eats mice",
+            "orange elephant never forgets",
+            "cat",
+        ]
+        texts = [text.split() for text in texts]
+        V = self.compute_V(texts)
+        mgp = MovieGroupProcess(K=4, n_iters=5, alpha=0.2, beta=0.01, random_state=47)
+        mgp.fit(texts, V)
+
+        n_z_w = mgp.cluster_word_distribution
+        for doc in texts + [["purple", "cat"], []]:
+            expected = []
+            for z in range(mgp.K):
+                lp = math.log(mgp.cluster_doc_count[z] + mgp.alpha) - math.log(len(texts) - 1 + mgp.K * mgp.alpha)
+                for word in doc:
+                    lp += math.log(n_z_w[z].get(word, 0) + mgp.beta)
+                for j in range(1, len(doc) + 1):
+                    lp -= math.log(mgp.cluster_word_count[z] + V * mgp.beta + j - 1)
+                expected.append(math.exp(lp))
+            total = sum(expected)
+            for p, e in zip(mgp.score(doc), expected):
+                self.assertAlmostEqual(p, e / total, places=12)
+
+    def test_sampler_tables_match_score(self):
+        texts = [text.split() for text in [
+            "blue cat eats mice",
+            "green cat eats mice",
+            "monkeys eat banana",
+            "monkeys live in trees",
+            "elephant",
+        ]]
+        corpus = Corpus.from_docs(texts)
+        mgp = MovieGroupProcess(K=3, n_iters=5, alpha=0.1, beta=0.05, random_state=47)
+        mgp.fit_corpus(corpus)
+        sampler = GibbsSampler(mgp.cluster_doc_count, mgp.cluster_word_count, mgp.cluster_word_matrix,
+                               mgp.alpha, mgp.beta, mgp.vocab_size, mgp.number_docs, 4, len(texts))
+        for i in range(len(corpus)):
+            numpy.testing.assert_allclose(sampler.score(corpus[i]), mgp._score_ids(corpus[i], 0), rtol=1e-12)
+
+    def test_predict_matches_score(self):
+        texts = [text.split() for text in [
+            "blue cat eats mice",
+            "green cat eats mice",
+            "monkeys eat banana",
+            "monkeys live in trees",
+            "orange elephant never forgets",
+        ]]
+        mgp = MovieGroupProcess(K=4, n_iters=5, alpha=0.1, beta=0.05, random_state=47)
+        mgp.fit(texts, self.compute_V(texts))
+
+        docs = texts + [[], ["purple", "elephant"], ["cat"]]
+        expected = numpy.array([mgp.score(doc) for doc in docs])
+        for batch_size in (1, 3, 100):
+            numpy.testing.assert_allclose(mgp.predict_proba(docs, batch_size=batch_size), expected, rtol=1e-12)
+        numpy.testing.assert_allclose(mgp.predict_proba(Corpus.from_docs(docs), batch_size=2, n_jobs=2), expected,
+                                      rtol=1e-12)
+        self.assertEqual(mgp.predict(docs).tolist(), [mgp.choose_best_label(doc)[0] for doc in docs])
+
+    def test_log_likelihood(self):
+        texts = [text.split() for text in [
+            "blue cat eats mice",
+            "green cat eats mice",
+            "monkeys eat banana",
+            "monkeys live in trees",
+        ]]
+        V = self.compute_V(texts)
+        mgp = MovieGroupProcess(K=3, n_iters=5, alpha=0.2, beta=0.05, random_state=47)
+        mgp.fit(texts, V)
+
+        K, alpha, beta = mgp.K, mgp.alpha, mgp.beta
+        expected = math.lgamma(K * alpha) - math.lgamma(len(texts) + K * alpha)
+        for z in range(K):
+            expected += math.lgamma(mgp.cluster_doc_count[z] + alpha) - math.lgamma(alpha)
+            expected += math.lgamma(V * beta) - math.lgamma(mgp.cluster_word_count[z] + V * beta)
+            for count in mgp.cluster_word_distribution[z].values():
+                expected += math.lgamma(count + beta) - math.lgamma(beta)
+        self.assertAlmostEqual(mgp.log_likelihood(), expected, places=9)
+        self.assertEqual(mgp.history[-1].log_likelihood, mgp.log_likelihood())
+
+    def test_stopping_rules(self):
+        texts = [text.split() for text in ["red dog", "blue cat", "red cat", "blue dog"]] * 5
+
+        mgp = MovieGroupProcess(K=4, n_iters=20, random_state=47)
+        mgp.fit(texts, 4, callback=lambda stats: stats.iteration == 2)
+        self.assertEqual([stats.iteration for stats in mgp.history], [0, 1, 2])
+        self.assertEqual(mgp.history[0].transfer_rate, mgp.history[0].transfers / len(texts))
+
+        mgp = MovieGroupProcess(K=4, n_iters=20, min_transfer_rate=1.1, random_state=47)
+        mgp.fit(texts, 4)
+        self.assertEqual(len(mgp.history), 1)
+
+        mgp = MovieGroupProcess(K=4, n_iters=20, tol=float('inf'), patience=2, random_state=47)
+        mgp.fit(texts, 4)
+        self.assertEqual(len(mgp.history), 3)
+
+    def test_sample_categorical(self):
+        p = numpy.array([0.0, 0.25, 0.0, 0.75, 0.0])
+        self.assertEqual(sample_categorical(p, 0.0), 1)
+        self.assertEqual(sample_categorical(p, 0.2499), 1)
+        self.assertEqual(sample_categorical(p, 0.25), 3)
+        self.assertEqual(sample_categorical(p, 0.9999), 3)
+        draws = [sample_categorical(p, u) for u in numpy.random.default_rng(0).random(1000)]
+        self.assertEqual(set(draws), {1, 3})
+
+    def test_random_state(self):
+        texts = [text.split() for text in ["red dog", "blue cat", "red cat", "blue dog"]] * 5
+        first = MovieGroupProcess(K=4, n_iters=5, random_state=1).fit(texts, 4)
+        second = MovieGroupProcess(K=4, n_iters=5, random_state=numpy.random.default_rng(1)).fit(texts, 4)
+        self.assertEqual(first, second)
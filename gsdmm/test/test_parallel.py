@@ -0,0 +1,52 @@
+from unittest import TestCase
+from gsdmm.corpus import Corpus
+from gsdmm.mgp import MovieGroupProcess
+import numpy
+
+
+class TestParallel(TestCase):
+    '''This class tests the sharded (AD-Gibbs) fitting mode'''
+
+    def setUp(self):
+        texts = [
+            "where the red dog lives",
+            "red dog lives in the house",
+            "blue cat eats mice",
+            "monkeys hate cat but love trees",
+            "green cat eats mice",
+            "orange elephant never forgets",
+            "orange elephant must forget",
+            "monkeys eat banana",
+            "monkeys live in trees",
+        ]
+        self.corpus = Corpus.from_docs([text.split() for text in texts] * 4)
+
+    def fit(self, seed):
+        mgp = MovieGroupProcess(K=6, n_iters=5, alpha=0.2, beta=0.01, random_state=seed)
+        return mgp, mgp.fit_corpus(self.corpus, n_jobs=3)
+
+    def test_counts_match_labels(self):
+        mgp, labels = self.fit(7)
+        K, W = mgp.K, len(self.corpus.vocabulary)
+        token_labels = numpy.repeat(labels, self.corpus.doc_lengths)
+        expected = numpy.bincount(token_labels * W + self.corpus.tokens, minlength=K * W).reshape(K, W)
+        numpy.testing.assert_array_equal(mgp.cluster_word_matrix, expected)
+        numpy.testing.assert_array_equal(mgp.cluster_doc_count, numpy.bincount(labels, minlength=K))
+        numpy.testing.assert_array_equal(mgp.cluster_word_count, numpy.bincount(token_labels, minlength=K))
+
+    def test_reproducible(self):
+        _, first = self.fit(11)
+        _, second = self.fit(11)
+        numpy.testing.assert_array_equal(first, second)
+
+    def test_weighted_counts_match_labels(self):
+        weights = numpy.arange(len(self.corpus)) % 3 + 1
+        mgp = MovieGroupProcess(K=6, n_iters=5, alpha=0.2, beta=0.01, random_state=5)
+        labels = mgp.fit_corpus(self.corpus, n_jobs=3, weights=weights)
+        K, W = mgp.K, len(self.corpus.vocabulary)
+        token_labels = numpy.repeat(labels, self.corpus.doc_lengths)
+        token_weights = numpy.repeat(weights, self.corpus.doc_lengths)
+        expected = numpy.bincount(token_labels * W + self.corpus.tokens, weights=token_weights, minlength=K * W)
+        numpy.testing.assert_array_equal(mgp.cluster_word_matrix, expected.reshape(K, W))
+        numpy.testing.assert_array_equal(mgp.cluster_doc_count, numpy.bincount(labels, weights=weights, minlength=K))
+        self.assertEqual(mgp.number_docs, weights.sum())
@@ -0,0 +1,55 @@
+from unittest import TestCase
+from gsdmm.mgp import MovieGroupProcess
+from gsdmm.storage import read_arrays, write_arrays
+import numpy
+import os
+import tempfile
+
+
+class TestStorage(TestCase):
+    '''This class tests the model file format'''
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'model.gsdmm')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_arrays_round_trip(self):
+        arrays = {'a': numpy.arange(7, dtype=numpy.int64), 'b': numpy.ones((3, 5), dtype=numpy.int32),
+                  'empty': numpy.zeros(0, dtype=numpy.uint8)}
+        write_arrays(self.path, {'K': 3}, arrays)
+        for mmap in (True, False):
+            fields, loaded = read_arrays(self.path, mmap)
+            self.assertEqual(fields, {'K': 3})
+            for name, array in arrays.items():
+                numpy.testing.assert_array_equal(loaded[name], array)
+                self.assertEqual(loaded[name].dtype, array.dtype)
+
+    def test_bad_magic(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a model')
+        self.assertRaises(ValueError, read_arrays, self.path)
+
+    def test_model_round_trip(self):
+        texts = [text.split() for text in [
+            "blue cat eats mice",
+            "grüne katze frisst mäuse",
+            "monkeys eat banana",
+            "monkeys live in trees",
+        ]]
+        mgp = MovieGroupProcess(K=3, n_iters=5, alpha=0.2, beta=0.05, random_state=5)
+        mgp.fit(texts, 16)
+        mgp.save(self.path)
+
+        loaded = MovieGroupProcess.load(self.path)
+        self.assertEqual((loaded.K, loaded.alpha, loaded.beta, loaded.number_docs, loaded.vocab_size),
+                         (3, 0.2, 0.05, 4, 16))
+        self.assertIsInstance(loaded.cluster_doc_count, numpy.memmap)
+        numpy.testing.assert_array_equal(loaded.cluster_doc_count, mgp.cluster_doc_count)
+        numpy.testing.assert_array_equal(loaded.cluster_word_count, mgp.cluster_word_count)
+        self.assertEqual(loaded.cluster_word_distribution, mgp.cluster_word_distribution)
+        for doc in texts + [["zebra"]]:
+            self.assertEqual(loaded.score(doc), mgp.score(doc))
+        del loaded
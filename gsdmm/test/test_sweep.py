@@ -0,0 +1,35 @@
+from unittest import TestCase
+from gsdmm.corpus import Corpus
+from gsdmm.mgp import MovieGroupProcess
+from gsdmm.sweep import run_sweep, model_name
+import numpy
+import os
+import tempfile
+
+
+class TestSweep(TestCase):
+    '''This class tests the parallel multi-K sweep runner'''
+
+    def test_model_name(self):
+        self.assertEqual(model_name(10, 0.1, 0.1, 0), '10clusters')
+        self.assertEqual(model_name(10, 0.1, 0.05, 2, {'beta', 'seed'}), '10clusters_beta0.05_seed2')
+
+    def test_run_sweep(self):
+        texts = [text.split() for text in [
+            "blue cat eats mice",
+            "green cat eats mice",
+            "monkeys eat banana",
+            "monkeys live in trees",
+            "orange elephant never forgets",
+        ]]
+        with tempfile.TemporaryDirectory() as path:
+            corpus_path = os.path.join(path, 'corpus')
+            Corpus.from_docs(texts).save(corpus_path)
+            results = run_sweep(corpus_path, [2, 3], seeds=[1], n_iters=5, output_dir=path, workers=2)
+            self.assertEqual([name for name, _ in results], ['2clusters', '3clusters'])
+
+            mgp = MovieGroupProcess.load(os.path.join(path, '3clusters.gsdmm'), mmap=False)
+            labels = numpy.load(os.path.join(path, '3clusters_labels.npy'))
+            self.assertEqual(mgp.K, 3)
+            self.assertEqual(len(labels), len(texts))
+            self.assertEqual(mgp.cluster_doc_count.sum(), len(texts))
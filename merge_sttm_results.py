@@ -1,18 +1,21 @@
 """
 @author: John Bica
-Script to pre-process and merge csvs into one single data-frame
+Script to merge the model results for every number of topics into the dashboard data files
 """
 
 import glob
 import pandas as pd
+from dashboard_data import load_topic_data, write_dashboard_data, write_payloads, write_topic_data
 
 data_dir = 'data/'  # directory to hold all target input CSV files
 
-# Read in CSVs into merged data frame
-tweets_df = pd.concat([pd.read_csv(file) for file in glob.glob(data_dir+'*topics.csv')], ignore_index=True)
-
-# Export merged data set to csv and pickle files
-tweets_df.to_csv(r'data/sttm_all_topics.csv', index=False, header=True)
-tweets_df.to_pkl(r'data/sttm_all_topics.pkl')
+# Normalize the model results into one tweet table plus a topics x tweets matrix of dominant topics
+data = write_dashboard_data(sorted(glob.glob(data_dir + '*topics.csv')), data_dir + 'dashboard')
+print('Complete. Number of Tweets: {}, numbers of topics: {}'.format(len(data.id), data.num_topics))
 
+# Store the topic words and topic names next to it as arrays the dashboard can memory map
+write_topic_data(pd.read_pickle(data_dir + 'topic_words.pkl'), pd.read_pickle(data_dir + 'topic_names.pkl'),
+                 data_dir + 'dashboard')
 
+# Precompute the bubble chart and topic table of every number of topics, so the dashboard serves them as they are
+write_payloads(*load_topic_data(data_dir + 'dashboard', mmap=False), data_dir + 'dashboard')
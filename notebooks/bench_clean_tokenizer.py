@@ -0,0 +1,189 @@
+"""
+@author: John Bica | Christopher Tso
+Script to benchmark and profile the tweet cleaning functions of clean_tokenizer
+
+Runs every cleaning stage over synthetic tweets at several corpus sizes and reports tweets/sec per stage
+as JSON lines tagged with the current git commit. The lemma cache is cleared before every stage so each
+stage starts cold, and the input of a stage (such as the .csv file read by the tokenize functions) is
+prepared outside of its timing. Requires the nltk wordnet data (see clean_tokenizer).
+
+Usage (from the notebooks directory):
+    python bench_clean_tokenizer.py --tweets 10000 100000 --output results.jsonl
+    python bench_clean_tokenizer.py --tweets 10000 --profile 15
+"""
+import argparse
+import contextlib
+import cProfile
+import io
+import json
+import os
+import platform
+import pstats
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import clean_tokenizer
+
+# Building blocks of the synthetic tweets, modeled on the scraped health news accounts
+words = ('health', 'study', 'patients', 'doctors', 'hospital', 'cancer', 'vaccine', 'vaccines', 'flu', 'season',
+         'heart', 'disease', 'research', 'researchers', 'found', 'says', 'women', 'children', 'kids', 'drug',
+         'drugs', 'treatment', 'care', 'insurance', 'coronavirus', 'outbreak', 'cases', 'risk', 'diet', 'sleep',
+         'exercise', 'brain', 'mental', 'obesity', 'diabetes', 'people', 'better', 'could', 'may', 'new', 'the',
+         'a', 'of', 'to', 'in', 'is', 'and', 'for', 'your', 'how', 'why', 'what', 'more', 'than', 'running',
+         'eating', 'living', 'linked', 'lowers', 'raises', 'million', 'year', 'years', 'week', 'today')
+users = ('@cnnhealth', '@foxnewshealth', '@harvardhealth', '@bbchealth', '@nytHealth', '@KHNews', '@Reuters_Health')
+hashtags = ('#health', '#COVID19', '#flu', '#cancer', '#mentalhealth', '#vaccines', '#obesity2020')
+links = ('http://cnn.it/{}', 'https://nyti.ms/{}', 'bit.ly/{}', 'pic.twitter.com/{}', '[link]')
+emoji = ('😷', '💉', '❤️', '🏥', '📝 …', '👉', '🔬')
+punctuation_marks = (',', '.', ':', '!', '?', ' -', "'s", ' (', ') ', ' &amp;', '...')
+
+
+def synthetic_tweets(n_tweets, seed=0):
+    """Generates tweets with mentions, hashtags, links, emoji, numbers, punctuation and
+    RT/VIDEO:/AUDIO: prefixes in proportions similar to the scraped data set
+
+    Args:
+        n_tweets = number of tweets
+        seed = random seed
+
+    Returns:
+        list of tweet strings
+    """
+    rng = np.random.default_rng(seed)
+    tweets = []
+    for _ in range(n_tweets):
+        parts = [words[i] for i in rng.integers(len(words), size=rng.integers(6, 25))]
+        for i in rng.integers(len(parts), size=rng.integers(0, 4)):
+            parts[i] += punctuation_marks[rng.integers(len(punctuation_marks))]
+        if rng.random() < 0.2:
+            parts.insert(rng.integers(len(parts)), str(rng.integers(1, 5000)))
+        if rng.random() < 0.3:
+            parts.insert(rng.integers(len(parts)), users[rng.integers(len(users))])
+        if rng.random() < 0.3:
+            parts.append(hashtags[rng.integers(len(hashtags))])
+        if rng.random() < 0.15:
+            parts.insert(rng.integers(len(parts)), emoji[rng.integers(len(emoji))])
+        if rng.random() < 0.8:
+            parts.append(links[rng.integers(len(links))].format(rng.integers(36 ** 6)))
+        prefix = rng.random()
+        if prefix < 0.05:
+            parts.insert(0, 'VIDEO:')
+        elif prefix < 0.08:
+            parts.insert(0, 'AUDIO:')
+        elif prefix < 0.15:
+            parts.insert(0, 'RT ' + users[rng.integers(len(users))] + ':')
+        tweets.append(' '.join(parts))
+    return tweets
+
+
+def _reset_lemma_cache():
+    cache = clean_tokenizer.lemma_cache
+    cache.table.clear()
+    cache.hits = cache.misses = 0
+
+
+def _write_csv(tweets, data_path):
+    """Writes the tweets to a .csv file as read by the file based tokenize functions, once per corpus"""
+    if not os.path.exists(data_path):
+        pd.DataFrame({'id': np.arange(len(tweets)), 'tweet': tweets}).to_csv(data_path, index=False)
+    return data_path
+
+
+def stages(tweets, data_path, workers):
+    """Returns the (name, setup, function) triples benchmarked for one corpus. setup() prepares the input
+    of function outside of the timing; only function(setup()) is timed."""
+    return [
+        ('basic_clean', lambda: tweets, lambda tweets: [clean_tokenizer.basic_clean(tweet) for tweet in tweets]),
+        ('lemmatize', lambda: [clean_tokenizer.basic_clean(tweet) for tweet in tweets],
+         lambda basic: [clean_tokenizer.lemmatize(tweet) for tweet in basic]),
+        ('clean_tweet', lambda: tweets, lambda tweets: [clean_tokenizer.clean_tweet(tweet) for tweet in tweets]),
+        ('clean_tweet_bigrams', lambda: tweets,
+         lambda tweets: [clean_tokenizer.clean_tweet(tweet, bigrams=True) for tweet in tweets]),
+        ('tokenize_tweets', lambda: _write_csv(tweets, data_path), clean_tokenizer.tokenize_tweets),
+        ('tokenize_tweets_parallel', lambda: _write_csv(tweets, data_path),
+         lambda path: clean_tokenizer.tokenize_tweets_parallel(path, workers=workers)),
+    ]
+
+
+def run_case(n_tweets, seed=0, workers=None, profile=None, selected=None):
+    """Benchmarks every stage on one corpus size
+
+    Args:
+        n_tweets = number of synthetic tweets
+        seed = random seed of the generator
+        workers = worker processes of tokenize_tweets_parallel
+        profile = print a cProfile breakdown of the top functions of every stage when set
+        selected = names of the stages to run, all when None
+
+    Returns:
+        list of result dictionaries, one per stage
+    """
+    tweets = synthetic_tweets(n_tweets, seed)
+    results = []
+    with tempfile.TemporaryDirectory() as path:
+        for name, setup, function in stages(tweets, os.path.join(path, 'tweets.csv'), workers):
+            if selected and name not in selected:
+                continue
+            stage_input = setup()
+            _reset_lemma_cache()
+            profiler = cProfile.Profile() if profile else None
+            cache = clean_tokenizer.lemma_cache
+            # the tokenize functions print progress, keep stdout for the JSON lines
+            with contextlib.redirect_stdout(sys.stderr):
+                start = time.perf_counter()
+                if profiler is not None:
+                    profiler.runcall(function, stage_input)
+                else:
+                    function(stage_input)
+                seconds = time.perf_counter() - start
+            lookups = cache.hits + cache.misses
+            results.append({'stage': name, 'tweets': n_tweets, 'seconds': seconds,
+                            'tweets_per_second': n_tweets / seconds,
+                            'lemma_hit_rate': cache.hits / lookups if lookups else None})
+            if profiler is not None:
+                out = io.StringIO()
+                pstats.Stats(profiler, stream=out).sort_stats('tottime').print_stats(profile)
+                print('--- {} ({} tweets) ---\n{}'.format(name, n_tweets, out.getvalue()), file=sys.stderr)
+    return results
+
+
+def _commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the tweet cleaning functions of clean_tokenizer')
+    parser.add_argument('--tweets', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--stages', nargs='+', help='stages to run, default all')
+    parser.add_argument('--workers', type=int, default=None, help='processes of tokenize_tweets_parallel')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--profile', type=int, metavar='N', help='print the top N functions of each stage')
+    parser.add_argument('--output', help='append JSON lines to this file instead of stdout')
+    args = parser.parse_args(argv)
+
+    meta = {'commit': _commit(), 'python': platform.python_version(), 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    results = [dict(meta, **result) for n_tweets in args.tweets
+               for result in run_case(n_tweets, args.seed, args.workers, args.profile, args.stages)]
+
+    lines = '\n'.join(json.dumps(result) for result in results) + '\n'
+    if args.output:
+        with open(args.output, 'a') as f:
+            f.write(lines)
+    else:
+        sys.stdout.write(lines)
+    for result in results:
+        print('{:>8} tweets {:<26} {:>10.0f} tweets/s'.format(result['tweets'], result['stage'],
+                                                              result['tweets_per_second']), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
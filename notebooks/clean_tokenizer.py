@@ -5,10 +5,16 @@ Script to clean tweet data and tokenize
 import pandas as pd
 import numpy as np
 import re
+import json
 import nltk
 import gensim
 import tqdm
+import os
+import hashlib
+import sqlite3
 
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from nltk.tokenize import RegexpTokenizer
 from nltk.corpus import stopwords
 from nltk.stem import WordNetLemmatizer
@@ -21,94 +27,467 @@ from tqdm.notebook import trange, tqdm
 
 punctuation = '!"$%&\'()*+,-./:;<=>?[\\]^_`{|}~•@'         # define a string of punctuation symbols
 
+# Patterns used to clean tweets, compiled once
+user_retweet_pattern = re.compile(r'(RT\s@[A-Za-z]+[A-Za-z0-9-_]+)')
+user_pattern = re.compile(r'(@[A-Za-z]+[A-Za-z0-9-_]+)')
+link_http_pattern = re.compile(r'http\S+')
+link_bitly_pattern = re.compile(r'bit.ly/\S+')
+link_pic_pattern = re.compile(r'pic.twitter\S+')
+hashtag_pattern = re.compile(r'(#[A-Za-z]+[A-Za-z0-9-_]+)')
+punctuation_pattern = re.compile('[' + punctuation + ']+')
+whitespace_pattern = re.compile(r'\s+')
+digits_pattern = re.compile(r'([0-9]+)')
+
+
 # Functions to clean tweets
 def remove_links(tweet):
     """Takes a string and removes web links from it"""
-    tweet = re.sub(r'http\S+', '', tweet)   # remove http links
-    tweet = re.sub(r'bit.ly/\S+', '', tweet)  # remove bitly links
+    tweet = link_http_pattern.sub('', tweet)   # remove http links
+    tweet = link_bitly_pattern.sub('', tweet)  # remove bitly links
     tweet = tweet.strip('[link]')   # remove [links]
-    tweet = re.sub(r'pic.twitter\S+','', tweet)
+    tweet = link_pic_pattern.sub('', tweet)
     return tweet
 
 def remove_users(tweet):
     """Takes a string and removes retweet and @user information"""
-    tweet = re.sub('(RT\s@[A-Za-z]+[A-Za-z0-9-_]+)', '', tweet)  # remove re-tweet
-    tweet = re.sub('(@[A-Za-z]+[A-Za-z0-9-_]+)', '', tweet)  # remove tweeted at
+    tweet = user_retweet_pattern.sub('', tweet)  # remove re-tweet
+    tweet = user_pattern.sub('', tweet)  # remove tweeted at
     return tweet
 
 def remove_hashtags(tweet):
     """Takes a string and removes any hash tags"""
-    tweet = re.sub('(#[A-Za-z]+[A-Za-z0-9-_]+)', '', tweet)  # remove hash tags
+    tweet = hashtag_pattern.sub('', tweet)  # remove hash tags
     return tweet
 
 def remove_av(tweet):
     """Takes a string and removes AUDIO/VIDEO tags or labels"""
-    tweet = re.sub('VIDEO:', '', tweet)  # remove 'VIDEO:' from start of tweet
-    tweet = re.sub('AUDIO:', '', tweet)  # remove 'AUDIO:' from start of tweet
+    tweet = tweet.replace('VIDEO:', '')  # remove 'VIDEO:' from start of tweet
+    tweet = tweet.replace('AUDIO:', '')  # remove 'AUDIO:' from start of tweet
     return tweet
 
+
+class TweetCleaner:
+    """Cleans tweets with the patterns above compiled once and as few passes over each tweet as possible.
+
+    Produces exactly the same output as the remove_* chain in clean_tweet and basic_clean: every
+    substitution still runs in the original order (later ones can match text exposed by earlier
+    removals), but a removal is skipped when the literal its pattern needs is absent, and
+    punctuation, whitespace and digits are handled with str.translate instead of separate regexes.
+
+    Args:
+        rules = removal steps to apply, any of TweetCleaner.RULES ('users', 'links', 'hashtags', 'av')
+    """
+    RULES = ('users', 'links', 'hashtags', 'av')
+
+    def __init__(self, rules=RULES):
+        unknown = set(rules) - set(self.RULES)
+        if unknown:
+            raise ValueError('Unknown cleaning rules: {}'.format(', '.join(sorted(unknown))))
+        self.rules = tuple(rule for rule in self.RULES if rule in rules)
+        # the characters punctuation_pattern matches (its class reads the backslash as an escape)
+        to_space = {ch: ' ' for ch in punctuation if punctuation_pattern.fullmatch(ch)}
+        to_delete = {ch: None for ch in '0123456789'}
+        self.punctuation_table = str.maketrans(to_space)
+        self.digits_table = str.maketrans(to_delete)
+        # for token output only token boundaries matter, so punctuation runs may become several spaces
+        self.token_table = str.maketrans({**to_space, **to_delete})
+
+    def remove(self, tweet):
+        """Applies the selected removal rules and lower cases the tweet"""
+        for rule in self.rules:
+            if rule == 'users':
+                if '@' in tweet:
+                    tweet = user_pattern.sub('', user_retweet_pattern.sub('', tweet))
+            elif rule == 'links':
+                if 'http' in tweet:
+                    tweet = link_http_pattern.sub('', tweet)
+                if 'bit' in tweet:
+                    tweet = link_bitly_pattern.sub('', tweet)
+                tweet = tweet.strip('[link]')
+                if 'pic' in tweet:
+                    tweet = link_pic_pattern.sub('', tweet)
+            elif rule == 'hashtags':
+                if '#' in tweet:
+                    tweet = hashtag_pattern.sub('', tweet)
+            elif rule == 'av':
+                tweet = remove_av(tweet)
+        return tweet.lower()
+
+    def basic(self, tweet):
+        """Same output as basic_clean"""
+        tweet = self.remove(tweet).translate(self.punctuation_table)
+        tweet = whitespace_pattern.sub(' ', tweet).translate(self.digits_table)
+        return tweet.replace('📝 …', '')
+
+    def tokens(self, tweet, bigrams=False):
+        """Same output as clean_tweet, as a list of lemmatized tokens"""
+        tweet_token_list = lemmatize(self.remove(tweet).translate(self.token_table))
+        if bigrams:
+            tweet_token_list = tweet_token_list + [tweet_token_list[i] + '_' + tweet_token_list[i + 1]
+                                                   for i in range(len(tweet_token_list) - 1)]
+        return tweet_token_list
+
+    def clean(self, tweet, bigrams=False):
+        """Same output as clean_tweet"""
+        return ' '.join(self.tokens(tweet, bigrams))
+
+
 def lemmatize(tweet):
     """Returns tokenized representation of words in lemma form excluding stopwords"""
     result = []
+    stop_words = gensim.parsing.preprocessing.STOPWORDS
     for token in gensim.utils.simple_preprocess(tweet):
-        if token not in gensim.parsing.preprocessing.STOPWORDS and len(
-                token) > 3:  # drops words with 3 or less characters
+        if token not in stop_words and len(token) > 3:  # drops words with 3 or less characters
             result.append(lemmatize_stemming(token))
     return result
 
 
+class LemmaCache:
+    """Reuses one WordNetLemmatizer and memoizes token -> lemma results in a size bounded LRU cache.
+
+    Tweet vocabulary is highly repetitive, so most lookups are served from the cache. The learned
+    lemma table can be saved to disk and preloaded on the next run.
+
+    Args:
+        maxsize = maximum number of tokens kept in the cache, None for no bound
+        pos = part of speech passed to the lemmatizer
+    """
+
+    def __init__(self, maxsize=100000, pos='v'):
+        self.maxsize = maxsize
+        self.pos = pos
+        self.lemmatizer = WordNetLemmatizer()
+        self.table = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def lemmatize(self, token):
+        """Returns lemmatization of a token"""
+        table = self.table
+        if token in table:
+            self.hits += 1
+            table.move_to_end(token)
+            return table[token]
+        self.misses += 1
+        lemma = table[token] = self.lemmatizer.lemmatize(token, pos=self.pos)
+        if self.maxsize is not None and len(table) > self.maxsize:
+            table.popitem(last=False)  # evict the least recently used token
+        return lemma
+
+    def info(self):
+        """Returns a dictionary of cache hits, misses and size"""
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.table), 'maxsize': self.maxsize}
+
+    def save(self, path):
+        """Writes the lemma table to a .json file"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.table, f, ensure_ascii=False)
+
+    def load(self, path):
+        """Preloads a lemma table written by save, keeping at most maxsize entries"""
+        with open(path, encoding='utf-8') as f:
+            table = json.load(f)
+        self.table.update(table)
+        while self.maxsize is not None and len(self.table) > self.maxsize:
+            self.table.popitem(last=False)
+
+
+lemma_cache = LemmaCache()  # shared cache used by lemmatize_stemming
+
+
 def lemmatize_stemming(token):
     """Returns lemmatization of a token"""
-    return WordNetLemmatizer().lemmatize(token, pos='v')
+    return lemma_cache.lemmatize(token)
 
 
 def clean_tweet(tweet, bigrams=False):
     """Main master function to clean tweets, stripping noisy characters and tokenizing use lemmatization"""
-    tweet = remove_users(tweet)
-    tweet = remove_links(tweet)
-    tweet = remove_hashtags(tweet)
-    tweet = remove_av(tweet)
-    tweet = tweet.lower()  # lower case
-    tweet = re.sub('[' + punctuation + ']+', ' ', tweet)  # strip punctuation
-    tweet = re.sub('\s+', ' ', tweet)  # remove double spacing
-    tweet = re.sub('([0-9]+)', '', tweet)  # remove numbers
-
-    tweet_token_list = lemmatize(tweet)  # apply lemmatization and tokenization
-
-    if bigrams:
-        tweet_token_list = tweet_token_list + [tweet_token_list[i] + '_' + tweet_token_list[i + 1]
-                                               for i in range(len(tweet_token_list) - 1)]
-    tweet = ' '.join(tweet_token_list)
-    return tweet
+    return default_cleaner.clean(tweet, bigrams)
 
 
 def basic_clean(tweet):
     """Main master function to clean tweets only without tokenization or removal of stopwords"""
-    tweet = remove_users(tweet)
-    tweet = remove_links(tweet)
-    tweet = remove_hashtags(tweet)
-    tweet = remove_av(tweet)
-    tweet = tweet.lower()  # lower case
-    tweet = re.sub('[' + punctuation + ']+', ' ', tweet)  # strip punctuation
-    tweet = re.sub('\s+', ' ', tweet)  # remove double spacing
-    tweet = re.sub('([0-9]+)', '', tweet)  # remove numbers
-    tweet = re.sub('📝 …', '', tweet)
-    return tweet
+    return default_cleaner.basic(tweet)
+
+
+default_cleaner = TweetCleaner()
+
+
+class CleanStore:
+    """Persistent store of cleaned tweets so that a rebuild only cleans new or changed tweets.
+
+    Entries live in a SQLite file with one row per tweet id and bigrams flag, holding the cleaned tweet
+    and a digest of the raw text plus the cleaner settings (cleaning rules, bigrams flag and
+    CLEANER_VERSION). An edited tweet or a change of settings no longer matches the stored digest, so it
+    is cleaned again and its row overwritten, while everything else is read back from the store.
+
+    Args:
+        path = path of the SQLite store file, created if missing
+        cleaner = TweetCleaner used for tweets missing from the store
+    """
+    CLEANER_VERSION = 1  # bump when a change to the cleaning functions alters their output
+    BATCH_SIZE = 500     # ids per lookup query, below the SQLite parameter limit
+
+    def __init__(self, path, cleaner=None):
+        self.cleaner = cleaner or default_cleaner
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS clean_tweets '
+                                '(id TEXT, bigrams INTEGER, digest TEXT, clean_tweet TEXT, PRIMARY KEY (id, bigrams))')
+        self.hits = 0
+        self.misses = 0
+
+    def digest(self, tweet, bigrams=False):
+        """Returns the hash of a raw tweet and the cleaner settings"""
+        settings = '{}|{}|{}|'.format(self.CLEANER_VERSION, ','.join(self.cleaner.rules), int(bigrams))
+        return hashlib.sha1((settings + tweet).encode('utf-8')).hexdigest()
 
+    def clean(self, ids, tweets, bigrams=False):
+        """Returns the cleaned tweets in order, cleaning and storing only those not found in the store"""
+        ids = [str(tweet_id) for tweet_id in ids]
+        digests = [self.digest(tweet, bigrams) for tweet in tweets]
+        stored = {}  # id -> (digest, cleaned tweet)
+        for start in range(0, len(ids), self.BATCH_SIZE):
+            batch = list(dict.fromkeys(ids[start:start + self.BATCH_SIZE]))
+            query = 'SELECT id, digest, clean_tweet FROM clean_tweets WHERE bigrams = ? AND id IN ({})'.format(
+                ','.join('?' * len(batch)))
+            stored.update((row[0], (row[1], row[2])) for row in self.connection.execute(query, [int(bigrams)] + batch))
 
-def tokenize_tweets(data_path):
+        result = []
+        new_rows = {}
+        for tweet_id, digest, tweet in zip(ids, digests, tweets):
+            entry = stored.get(tweet_id)
+            if entry is not None and entry[0] == digest:
+                self.hits += 1
+            else:
+                self.misses += 1
+                entry = stored[tweet_id] = (digest, self.cleaner.clean(tweet, bigrams))
+                new_rows[tweet_id] = (tweet_id, int(bigrams)) + entry
+            result.append(entry[1])
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO clean_tweets VALUES (?, ?, ?, ?)', new_rows.values())
+        return result
+
+    def info(self):
+        """Returns a dictionary of store hits, misses and size"""
+        size, = self.connection.execute('SELECT COUNT(*) FROM clean_tweets').fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'size': size}
+
+    def close(self):
+        self.connection.close()
+
+
+def tokenize_tweets(data_path, store_path=None):
     """Main function to read in and return clean data set.
     This can be used in Jupyter notebooks by importing this module and calling the tokenize_tweets() function
 
     Args:
         data_path = path to input data set .csv file
+        store_path = optional CleanStore file; tweets cleaned by a previous run are read back from it
 
     Returns:
         pandas data frame with cleaned tokens
     """
 
     tweets_df = pd.read_csv(data_path)
-    tweets_df['clean_tweet'] = tweets_df.tweet.apply(clean_tweet)
+    if store_path is not None:
+        store = CleanStore(store_path)
+        tweets_df['clean_tweet'] = store.clean(tweets_df.id, tweets_df.tweet)
+        store.close()
+    else:
+        tweets_df['clean_tweet'] = tweets_df.tweet.apply(clean_tweet)
     num_tweets = len(tweets_df)
     print('Complete. Number of Tweets that have been cleaned and tokenized : {}'.format(num_tweets))
-    return tweets_df
\ No newline at end of file
+    return tweets_df
+
+
+def _init_tokenize_worker(lemma_table_path):
+    """Warms the lemma cache of a worker process once, before it cleans any chunk"""
+    if lemma_table_path is not None and os.path.exists(lemma_table_path):
+        lemma_cache.load(lemma_table_path)
+
+
+def _clean_chunk(task):
+    tweets, bigrams = task
+    return [clean_tweet(tweet, bigrams) for tweet in tweets]
+
+
+def tokenize_tweets_parallel(data_path, workers=None, chunk_size=10000, bigrams=False, lemma_table_path=None):
+    """Parallel version of tokenize_tweets.
+    The tweet column is split into chunks of chunk_size tweets that are cleaned in a pool of worker
+    processes; the results are reassembled in the original order.
+
+    Args:
+        data_path = path to input data set .csv file
+        workers = number of worker processes, defaults to the number of CPUs
+        chunk_size = number of tweets sent to a worker at a time
+        bigrams = append bigram tokens to every cleaned tweet
+        lemma_table_path = optional .json lemma table (see LemmaCache.save) preloaded by every worker
+
+    Returns:
+        pandas data frame with cleaned tokens
+    """
+
+    tweets_df = pd.read_csv(data_path)
+    tweets = tweets_df.tweet.tolist()
+    tasks = [(tweets[start:start + chunk_size], bigrams) for start in range(0, len(tweets), chunk_size)]
+    workers = max(1, min(workers or os.cpu_count(), len(tasks)))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_tokenize_worker,
+                             initargs=(lemma_table_path,)) as pool:
+        tweets_df['clean_tweet'] = [tweet for chunk in pool.map(_clean_chunk, tasks) for tweet in chunk]
+    num_tweets = len(tweets_df)
+    print('Complete. Number of Tweets that have been cleaned and tokenized : {}'.format(num_tweets))
+    return tweets_df
+
+
+
+def iter_tokenized_chunks(data_path, chunk_size=10000, bigrams=False, store_path=None):
+    """Generator that reads the input .csv file in chunks and cleans one chunk at a time,
+    so at most chunk_size rows are held in memory.
+
+    Args:
+        data_path = path to input data set .csv file
+        chunk_size = number of rows read and cleaned at a time
+        bigrams = append bigram tokens to every cleaned tweet
+        store_path = optional CleanStore file; tweets cleaned by a previous run are read back from it
+
+    Yields:
+        pandas data frame of up to chunk_size rows with cleaned tokens
+    """
+
+    store = CleanStore(store_path) if store_path is not None else None
+    try:
+        for chunk in pd.read_csv(data_path, chunksize=chunk_size):
+            if store is not None:
+                chunk['clean_tweet'] = store.clean(chunk.id, chunk.tweet, bigrams)
+            else:
+                chunk['clean_tweet'] = [default_cleaner.clean(tweet, bigrams) for tweet in chunk.tweet]
+            yield chunk
+    finally:
+        if store is not None:
+            store.close()
+
+
+def stream_tokenize_tweets(data_path, output_path, chunk_size=10000, bigrams=False, tokens_path=None,
+                           store_path=None):
+    """Streaming version of tokenize_tweets for data sets that do not fit in memory.
+    Each chunk is appended to output_path as soon as it is cleaned, instead of returning one data frame.
+
+    Args:
+        data_path = path to input data set .csv file
+        output_path = path of the .csv file written with the input columns plus clean_tweet
+        chunk_size = maximum number of rows held in memory
+        bigrams = append bigram tokens to every cleaned tweet
+        tokens_path = optional path of a text file with the tokens of one tweet per line, see read_tokens
+        store_path = optional CleanStore file; tweets cleaned by a previous run are read back from it
+
+    Returns:
+        number of tweets written
+    """
+
+    num_tweets = 0
+    tokens_file = open(tokens_path, 'w', encoding='utf-8') if tokens_path is not None else None
+    try:
+        for chunk in iter_tokenized_chunks(data_path, chunk_size, bigrams, store_path):
+            chunk.to_csv(output_path, mode='w' if num_tweets == 0 else 'a', header=num_tweets == 0, index=False)
+            if tokens_file is not None:
+                tokens_file.writelines(tweet + '\n' for tweet in chunk.clean_tweet)
+            num_tweets += len(chunk)
+    finally:
+        if tokens_file is not None:
+            tokens_file.close()
+    print('Complete. Number of Tweets that have been cleaned and tokenized : {}'.format(num_tweets))
+    return num_tweets
+
+
+def write_token_corpus(data_path, corpus_path, chunk_size=10000, bigrams=False, store_path=None,
+                       metadata=('id', 'date', 'username', 'name')):
+    """Cleans a data set in chunks and writes it as a columnar corpus directory.
+    The token ids of all tweets are stored back to back in tokens.npy and tweet i spans
+    tokens[offsets[i]:offsets[i + 1]], next to vocabulary.json and one .npy file per metadata column.
+    This is the layout of gsdmm's Corpus, so the directory can be passed to Corpus.load and
+    MovieGroupProcess.fit_corpus (or gsdmm.sweep) without re-splitting the clean_tweet strings.
+
+    Args:
+        data_path = path to input data set .csv file
+        corpus_path = directory to write the corpus to
+        chunk_size = number of rows read and cleaned at a time
+        bigrams = append bigram tokens to every cleaned tweet
+        store_path = optional CleanStore file; tweets cleaned by a previous run are read back from it
+        metadata = columns of the input saved next to the tokens
+
+    Returns:
+        number of tweets written
+    """
+
+    vocabulary = []
+    word_index = {}
+    tokens = []
+    lengths = []
+    columns = {column: [] for column in metadata}
+    for chunk in iter_tokenized_chunks(data_path, chunk_size, bigrams, store_path):
+        chunk_tokens = []
+        for tweet in chunk.clean_tweet:
+            words = tweet.split()
+            for word in words:
+                if word not in word_index:
+                    word_index[word] = len(vocabulary)
+                    vocabulary.append(word)
+                chunk_tokens.append(word_index[word])
+            lengths.append(len(words))
+        tokens.append(np.array(chunk_tokens, dtype=np.int32))
+        for column in metadata:
+            if column == 'date':
+                columns[column].append(pd.to_datetime(chunk[column], errors='coerce').values.astype('datetime64[s]'))
+            elif pd.api.types.is_numeric_dtype(chunk[column]):
+                columns[column].append(chunk[column].to_numpy())
+            else:
+                columns[column].append(chunk[column].to_numpy(dtype=str))
+
+    os.makedirs(corpus_path, exist_ok=True)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    np.save(os.path.join(corpus_path, 'tokens.npy'), np.concatenate(tokens) if tokens else np.zeros(0, np.int32))
+    np.save(os.path.join(corpus_path, 'offsets.npy'), offsets)
+    with open(os.path.join(corpus_path, 'vocabulary.json'), 'w', encoding='utf-8') as f:
+        json.dump(vocabulary, f, ensure_ascii=False)
+    for column, values in columns.items():
+        if values:
+            np.save(os.path.join(corpus_path, column + '.npy'), np.concatenate(values))
+    print('Complete. Number of Tweets that have been cleaned and tokenized : {}'.format(len(lengths)))
+    return len(lengths)
+
+
+def load_token_corpus(corpus_path, mmap=True, metadata=('id', 'date', 'username', 'name')):
+    """Reads a corpus directory written by write_token_corpus.
+
+    Args:
+        corpus_path = corpus directory
+        mmap = memory map the arrays read-only instead of reading them into memory
+        metadata = metadata columns to load, skipping those that were not written
+
+    Returns:
+        vocabulary list, tokens array, offsets array and a dictionary of metadata arrays
+    """
+
+    mmap_mode = 'r' if mmap else None
+    tokens = np.load(os.path.join(corpus_path, 'tokens.npy'), mmap_mode=mmap_mode)
+    offsets = np.load(os.path.join(corpus_path, 'offsets.npy'), mmap_mode=mmap_mode)
+    with open(os.path.join(corpus_path, 'vocabulary.json'), encoding='utf-8') as f:
+        vocabulary = json.load(f)
+    columns = {column: np.load(os.path.join(corpus_path, column + '.npy'), mmap_mode=mmap_mode)
+               for column in metadata if os.path.exists(os.path.join(corpus_path, column + '.npy'))}
+    return vocabulary, tokens, offsets, columns
+
+
+def iter_bow(tokens, offsets):
+    """Generator over the bag-of-words (token id, count) lists of every tweet, as used by gensim models"""
+    for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist()):
+        ids, counts = np.unique(tokens[start:end], return_counts=True)
+        yield list(zip(ids.tolist(), counts.tolist()))
+
+
+def read_tokens(tokens_path):
+    """Generator over the token lists of a file written by stream_tokenize_tweets(tokens_path=...)"""
+    with open(tokens_path, encoding='utf-8') as f:
+        for line in f:
+            yield line.split()
@@ -0,0 +1,261 @@
+from unittest import TestCase
+import os
+import re
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # the notebooks directory
+import clean_tokenizer  # noqa: E402
+
+# the gsdmm project directory, for the Corpus that write_token_corpus must stay compatible with
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'gsdmm'))
+from gsdmm.corpus import Corpus  # noqa: E402
+
+punctuation = '!"$%&\'()*+,-./:;<=>?[\\]^_`{|}~•@'
+
+
+def reference_remove(tweet):
+    '''The re.sub chain that clean_tweet and basic_clean ran before TweetCleaner'''
+    tweet = re.sub(r'(RT\s@[A-Za-z]+[A-Za-z0-9-_]+)', '', tweet)
+    tweet = re.sub(r'(@[A-Za-z]+[A-Za-z0-9-_]+)', '', tweet)
+    tweet = re.sub(r'http\S+', '', tweet)
+    tweet = re.sub(r'bit.ly/\S+', '', tweet)
+    tweet = tweet.strip('[link]')
+    tweet = re.sub(r'pic.twitter\S+', '', tweet)
+    tweet = re.sub(r'(#[A-Za-z]+[A-Za-z0-9-_]+)', '', tweet)
+    tweet = re.sub('VIDEO:', '', tweet)
+    tweet = re.sub('AUDIO:', '', tweet)
+    tweet = tweet.lower()
+    tweet = re.sub('[' + punctuation + ']+', ' ', tweet)
+    tweet = re.sub(r'\s+', ' ', tweet)
+    tweet = re.sub('([0-9]+)', '', tweet)
+    return tweet
+
+
+def reference_basic_clean(tweet):
+    return re.sub('📝 …', '', reference_remove(tweet))
+
+
+def reference_clean_tweet(tweet, bigrams=False):
+    tokens = clean_tokenizer.lemmatize(reference_remove(tweet))
+    if bigrams:
+        tokens = tokens + [tokens[i] + '_' + tokens[i + 1] for i in range(len(tokens) - 1)]
+    return ' '.join(tokens)
+
+
+class SuffixLemmatizer:
+    '''Stands in for WordNetLemmatizer so the tests do not need the wordnet data'''
+
+    def lemmatize(self, token, pos='v'):
+        return token[:-1] if token.endswith('s') else token
+
+
+class TestTweetCleaner(TestCase):
+    '''This class tests that TweetCleaner matches the original regular expression chain'''
+
+    tweets = [
+        "RT @cnnhealth: New study links coffee to better heart health http://cnn.it/2xYz",
+        "VIDEO: Doctors explain the 2019-2020 flu season &amp; what it means for kids https://nyti.ms/abc",
+        "AUDIO: Why running 30 minutes a day lowers your risk 📝 … bit.ly/3kQ pic.twitter.com/xyz",
+        "@KHNews @Reuters_Health Insurance costs rose 12% in 2018 #health #COVID19 [link]",
+        "[link] Researchers found 1,000,000 cases of obesity2020... #obesity2020",
+        "Vaccines work 💉😷 says @harvardhealth, but can't stop every outbreak!!! (study)",
+        "link: the clinic's \"new\" drugs — 5x cheaper? ~ ^_^ {maybe} |yes| <no> •",
+        "RT   @bbchealth   double  spaced\ttabs\nand newlines 42",
+        "",
+        "1234 5678",
+        "Sleep, diet & exercise: A year of living better 🏥❤️ http://x.co/1 http://y.co/2",
+        "@a1 @_x @ab-c_d email@example.com user@ RT@nospace",
+    ]
+
+    def setUp(self):
+        self.lemmatizer = clean_tokenizer.lemma_cache.lemmatizer
+        clean_tokenizer.lemma_cache.lemmatizer = SuffixLemmatizer()
+        clean_tokenizer.lemma_cache.table.clear()
+
+    def tearDown(self):
+        clean_tokenizer.lemma_cache.lemmatizer = self.lemmatizer
+        clean_tokenizer.lemma_cache.table.clear()
+
+    def test_basic_clean(self):
+        for tweet in self.tweets:
+            self.assertEqual(clean_tokenizer.basic_clean(tweet), reference_basic_clean(tweet), tweet)
+
+    def test_clean_tweet(self):
+        for tweet in self.tweets:
+            self.assertEqual(clean_tokenizer.clean_tweet(tweet), reference_clean_tweet(tweet), tweet)
+            self.assertEqual(clean_tokenizer.clean_tweet(tweet, bigrams=True),
+                             reference_clean_tweet(tweet, bigrams=True), tweet)
+
+    def test_rules(self):
+        cleaner = clean_tokenizer.TweetCleaner(rules=('links',))
+        self.assertEqual(cleaner.basic('@cnnhealth flu http://cnn.it/x'), ' cnnhealth flu ')
+        with self.assertRaises(ValueError):
+            clean_tokenizer.TweetCleaner(rules=('emoji',))
+
+
+class TestCleanStore(TestCase):
+    '''This class tests that the CleanStore reuses cleaned tweets only while they are still valid'''
+
+    def setUp(self):
+        self.lemmatizer = clean_tokenizer.lemma_cache.lemmatizer
+        clean_tokenizer.lemma_cache.lemmatizer = SuffixLemmatizer()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'clean.sqlite')
+
+    def tearDown(self):
+        clean_tokenizer.lemma_cache.lemmatizer = self.lemmatizer
+        clean_tokenizer.lemma_cache.table.clear()
+        self.directory.cleanup()
+
+    def clean(self, ids, tweets, bigrams=False, version=None):
+        store = clean_tokenizer.CleanStore(self.path)
+        if version is not None:
+            store.CLEANER_VERSION = version
+        result = store.clean(ids, tweets, bigrams)
+        info = store.info()
+        store.close()
+        return result, info
+
+    def test_hit(self):
+        ids, tweets = [1, 2], ['Doctors warn about flu seasons', 'Vaccines protect children']
+        result, info = self.clean(ids, tweets)
+        self.assertEqual(result, [clean_tokenizer.clean_tweet(tweet) for tweet in tweets])
+        self.assertEqual((info['hits'], info['misses'], info['size']), (0, 2, 2))
+        result_again, info = self.clean(ids, tweets)
+        self.assertEqual(result_again, result)
+        self.assertEqual((info['hits'], info['misses'], info['size']), (2, 0, 2))
+
+    def test_miss_after_text_change(self):
+        self.clean([1, 2], ['Doctors warn about flu seasons', 'Vaccines protect children'])
+        result, info = self.clean([1, 2], ['Doctors warn about measles outbreaks', 'Vaccines protect children'])
+        self.assertEqual(result[0], clean_tokenizer.clean_tweet('Doctors warn about measles outbreaks'))
+        self.assertEqual((info['hits'], info['misses'], info['size']), (1, 1, 2))  # the old row is replaced
+
+    def test_miss_after_version_bump(self):
+        tweets = ['Doctors warn about flu seasons', 'Vaccines protect children']
+        self.clean([1, 2], tweets)
+        result, info = self.clean([1, 2], tweets, version=clean_tokenizer.CleanStore.CLEANER_VERSION + 1)
+        self.assertEqual(result, [clean_tokenizer.clean_tweet(tweet) for tweet in tweets])
+        self.assertEqual((info['hits'], info['misses'], info['size']), (0, 2, 2))
+
+    def test_bigrams_kept_apart(self):
+        tweet = ['Doctors warn about flu seasons']
+        self.clean([1], tweet)
+        result, info = self.clean([1], tweet, bigrams=True)
+        self.assertEqual(result, [clean_tokenizer.clean_tweet(tweet[0], bigrams=True)])
+        self.assertEqual((info['misses'], info['size']), (1, 2))
+        _, info = self.clean([1], tweet)
+        self.assertEqual((info['hits'], info['size']), (1, 2))
+
+
+class TestLemmaCache(TestCase):
+    '''This class tests the bounded LRU cache of token lemmas'''
+
+    def setUp(self):
+        self.cache = clean_tokenizer.LemmaCache(maxsize=2)
+        self.cache.lemmatizer = SuffixLemmatizer()
+
+    def test_counters(self):
+        self.assertEqual([self.cache.lemmatize(token) for token in ['doctors', 'doctors', 'vaccines', 'doctors']],
+                         ['doctor', 'doctor', 'vaccine', 'doctor'])
+        self.assertEqual(self.cache.info(), {'hits': 2, 'misses': 2, 'size': 2, 'maxsize': 2})
+
+    def test_lru_eviction_order(self):
+        for token in ['doctors', 'vaccines', 'doctors', 'studies']:  # 'vaccines' is the least recently used
+            self.cache.lemmatize(token)
+        self.assertEqual(list(self.cache.table), ['doctors', 'studies'])
+        self.cache.lemmatize('vaccines')
+        self.assertEqual(list(self.cache.table), ['studies', 'vaccines'])
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 4))
+
+    def test_save_load(self):
+        cache = clean_tokenizer.LemmaCache(maxsize=None)
+        cache.lemmatizer = SuffixLemmatizer()
+        for token in ['doctors', 'vaccines', 'studies', 'flu']:
+            cache.lemmatize(token)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'lemmas.json')
+            cache.save(path)
+            self.cache.load(path)
+        self.assertEqual(dict(self.cache.table), {'studies': 'studie', 'flu': 'flu'})  # the most recent entries
+        self.assertEqual(self.cache.lemmatize('flu'), 'flu')
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 0))
+
+
+class TestTokenize(TestCase):
+    '''This class tests that the chunked tokenize functions give the same output as tokenize_tweets'''
+
+    def setUp(self):
+        self.lemmatizer = clean_tokenizer.lemma_cache.lemmatizer
+        clean_tokenizer.lemma_cache.lemmatizer = SuffixLemmatizer()
+        clean_tokenizer.lemma_cache.table.clear()
+        self.directory = tempfile.TemporaryDirectory()
+        self.data_path = os.path.join(self.directory.name, 'tweets.csv')
+        tweets = [tweet + ' ' + str(i) if i % 3 else tweet
+                  for i, tweet in enumerate(TestTweetCleaner.tweets * 2) if tweet]
+        dates = ['2020-01-{:02d} 10:00:00'.format(i % 28 + 1) if i != 7 else 'not a date' for i in range(len(tweets))]
+        pd.DataFrame({'id': range(100, 100 + len(tweets)), 'date': dates, 'username': 'cnnhealth',
+                      'name': 'CNN Health', 'tweet': tweets}).to_csv(self.data_path, index=False)
+        self.expected = clean_tokenizer.tokenize_tweets(self.data_path)
+
+    def tearDown(self):
+        clean_tokenizer.lemma_cache.lemmatizer = self.lemmatizer
+        clean_tokenizer.lemma_cache.table.clear()
+        self.directory.cleanup()
+
+    def test_parallel(self):
+        # the workers start from a lemma table of every token, so they never need the wordnet data
+        lemma_table_path = os.path.join(self.directory.name, 'lemmas.json')
+        clean_tokenizer.lemma_cache.save(lemma_table_path)
+        result = clean_tokenizer.tokenize_tweets_parallel(self.data_path, workers=2, chunk_size=5,
+                                                          lemma_table_path=lemma_table_path)
+        self.assertGreater(len(self.expected), 5 * 2)
+        pd.testing.assert_frame_equal(result, self.expected)
+
+    def test_iter_tokenized_chunks(self):
+        chunks = list(clean_tokenizer.iter_tokenized_chunks(self.data_path, chunk_size=5))
+        self.assertEqual([len(chunk) for chunk in chunks[:-1]], [5] * (len(chunks) - 1))
+        pd.testing.assert_frame_equal(pd.concat(chunks), self.expected)
+
+    def test_stream_tokenize_tweets(self):
+        output_path = os.path.join(self.directory.name, 'clean_tweets.csv')
+        tokens_path = os.path.join(self.directory.name, 'tokens.txt')
+        num_tweets = clean_tokenizer.stream_tokenize_tweets(self.data_path, output_path, chunk_size=5,
+                                                            tokens_path=tokens_path)
+        self.assertEqual(num_tweets, len(self.expected))
+        written = pd.read_csv(output_path, keep_default_na=False)
+        self.assertEqual(written.id.tolist(), self.expected.id.tolist())
+        self.assertEqual(written.clean_tweet.tolist(), self.expected.clean_tweet.tolist())
+        self.assertEqual(list(clean_tokenizer.read_tokens(tokens_path)),
+                         [tweet.split() for tweet in self.expected.clean_tweet])
+
+    def test_store(self):
+        store_path = os.path.join(self.directory.name, 'clean.sqlite')
+        for _ in range(2):  # cleaned, then read back from the store
+            chunks = list(clean_tokenizer.iter_tokenized_chunks(self.data_path, chunk_size=5, store_path=store_path))
+            self.assertEqual(pd.concat(chunks).clean_tweet.tolist(), self.expected.clean_tweet.tolist())
+
+    def test_token_corpus(self):
+        corpus_path = os.path.join(self.directory.name, 'corpus')
+        num_tweets = clean_tokenizer.write_token_corpus(self.data_path, corpus_path, chunk_size=5)
+        self.assertEqual(num_tweets, len(self.expected))
+        vocabulary, tokens, offsets, columns = clean_tokenizer.load_token_corpus(corpus_path)
+        self.assertEqual(columns['id'].tolist(), self.expected.id.tolist())
+        self.assertTrue(np.isnat(columns['date'][7]))  # malformed dates become NaT
+        self.assertEqual(str(columns['date'][0]), '2020-01-01T10:00:00')
+
+        corpus = Corpus.load(corpus_path)  # the same layout as gsdmm's Corpus.save
+        self.assertEqual(len(corpus), len(self.expected))
+        self.assertEqual(corpus.vocabulary, vocabulary)
+        for i, tweet in enumerate(self.expected.clean_tweet):
+            self.assertEqual(corpus.decode(i), tweet.split())
+        saved_path = os.path.join(self.directory.name, 'saved')
+        Corpus.from_docs([tweet.split() for tweet in self.expected.clean_tweet]).save(saved_path)
+        for name in ('tokens.npy', 'offsets.npy', 'vocabulary.json'):
+            with open(os.path.join(corpus_path, name), 'rb') as written:
+                with open(os.path.join(saved_path, name), 'rb') as saved:
+                    self.assertEqual(written.read(), saved.read(), name)
@@ -4,24 +4,75 @@ Script to pre-process and merge csvs into one single data-frame
 """
 
 import glob
+import os
+import numpy as np
 import pandas as pd
 
 data_dir = 'input/'           # directory to hold all target input CSV files
+output_path = 'input/health_tweets.csv'
+chunk_size = 100000           # rows held in memory at a time
 
-# Read in CSVs into merged data frame
-tweets_df = pd.concat([pd.read_csv(file) for file in glob.glob(data_dir+'*.csv')], ignore_index=True)
+# Columns never kept, and the dtypes of the kept Twint columns (nullable where Twint may leave blanks)
+dropped_columns = ['conversation_id', 'created_at', 'cashtags', 'user_id', 'user_id_str', 'link', 'search',
+                   'reply_to']
+dtypes = {'id': 'Int64', 'date': str, 'timezone': str, 'tweet': str, 'hashtags': str, 'username': str,
+          'name': str, 'day': 'Int64', 'hour': 'Int64', 'retweet': 'boolean', 'nlikes': 'Int64',
+          'nreplies': 'Int64', 'nretweets': 'Int64', 'video': 'Int64'}
 
-# Drop any columns with nan values in remaining data set
-tweets_df = tweets_df.dropna(axis='columns')
 
-# Drop any un-necessary columns not needed
-tweets_df = tweets_df.drop(columns=['conversation_id', 'created_at', 'cashtags', 'user_id',
-                                    'user_id_str', 'link', 'search', 'reply_to'])
+def tweet_hashes(tweets):
+    """Returns 64 bit hashes of tweet texts, treating missing tweets as one value like drop_duplicates does"""
+    return pd.util.hash_array(tweets.fillna('').to_numpy(dtype=object))
 
-# Remove any duplicates based on exact tweet matches
-tweets_df.drop_duplicates(keep=False, inplace=True, subset="tweet")
 
-# Export preprocessed clean data set to csv
-tweets_df.to_csv(r'input/health_tweets.csv', index=False, header=True)
+def scan_files(files):
+    """First pass over the files, one chunk at a time
 
+    Returns:
+        hashes of the tweets seen more than once, and the kept columns: those present in every file
+        without a missing value, less dropped_columns (what dropna(axis='columns') kept in the merged frame)
+    """
+    hashes = []
+    columns = None
+    with_missing = set()
+    for file in files:
+        for chunk in pd.read_csv(file, dtype=str, chunksize=chunk_size):
+            hashes.append(tweet_hashes(chunk.tweet))
+            with_missing.update(chunk.columns[chunk.isna().any()])
+            columns = list(chunk.columns) if columns is None else [c for c in columns if c in chunk.columns]
+    kept = [c for c in columns or [] if c not in with_missing and c not in dropped_columns]
+    if not hashes:
+        return np.zeros(0, dtype=np.uint64), kept
+    hashes, counts = np.unique(np.concatenate(hashes), return_counts=True)
+    return hashes[counts > 1], kept
 
+
+def merge_tweets(files, output_path):
+    """Merges the CSV files into output_path one chunk at a time, dropping every tweet whose text
+    occurs more than once (the keep=False semantics of drop_duplicates)
+
+    Args:
+        files = list of input .csv files
+        output_path = path of the merged .csv file
+
+    Returns:
+        number of tweets written
+    """
+
+    duplicates, columns = scan_files(files)
+    column_dtypes = {column: dtypes[column] for column in columns if column in dtypes}
+    num_tweets = 0
+    for file in files:
+        for chunk in pd.read_csv(file, usecols=columns, dtype=column_dtypes, chunksize=chunk_size):
+            chunk = chunk[columns][~np.isin(tweet_hashes(chunk.tweet), duplicates)]
+            chunk.to_csv(output_path, mode='w' if num_tweets == 0 else 'a', header=num_tweets == 0, index=False)
+            num_tweets += len(chunk)
+    return num_tweets
+
+
+if __name__ == '__main__':
+    # Merge the scraped CSVs (except a previous output) with duplicate tweets removed
+    input_files = sorted(file for file in glob.glob(data_dir + '*.csv')
+                         if os.path.abspath(file) != os.path.abspath(output_path))
+    num_tweets = merge_tweets(input_files, output_path)
+    print('Complete. Number of Tweets merged : {}'.format(num_tweets))
@@ -0,0 +1,93 @@
+from unittest import TestCase, mock
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # the dashboard modules
+from callback_cache import CallbackCache  # noqa: E402
+
+
+class TestCallbackCache(TestCase):
+    '''This class tests the bounded LRU cache of the dashboard callbacks'''
+
+    def setUp(self):
+        self.calls = []
+
+    def compute(self, value):
+        def function():
+            self.calls.append(value)
+            return value
+        return function
+
+    def test_lru_eviction_order(self):
+        cache = CallbackCache(maxsize=2, ttl=None)
+        cache.get('a', self.compute(1))
+        cache.get('b', self.compute(2))
+        cache.get('a', self.compute(1))  # 'a' becomes the most recently used result
+        cache.get('c', self.compute(3))  # evicts 'b'
+        self.assertEqual(cache.info()['size'], 2)
+        self.assertEqual(cache.get('a', self.compute(10)), 1)
+        self.assertEqual(cache.get('b', self.compute(20)), 20)
+        self.assertEqual(self.calls, [1, 2, 3, 20])
+        self.assertEqual((cache.hits, cache.misses), (2, 4))
+
+    def test_ttl_memory(self):
+        cache = CallbackCache(ttl=60)
+        now = time.time()
+        with mock.patch('callback_cache.time.time', return_value=now):
+            cache.get('a', self.compute(1))
+        with mock.patch('callback_cache.time.time', return_value=now + 59):
+            self.assertEqual(cache.get('a', self.compute(2)), 1)
+        with mock.patch('callback_cache.time.time', return_value=now + 61):
+            self.assertEqual(cache.get('a', self.compute(3)), 3)
+        self.assertEqual(self.calls, [1, 3])
+
+    def test_ttl_disk(self):
+        with tempfile.TemporaryDirectory() as directory:
+            CallbackCache(ttl=60, directory=directory).get('a', self.compute(1))
+            cache = CallbackCache(ttl=60, directory=directory)  # as another worker, with an empty memory cache
+            self.assertEqual(cache.get('a', self.compute(2)), 1)
+            self.assertEqual(cache.disk_hits, 1)
+
+            path, = [os.path.join(directory, name) for name in os.listdir(directory)]
+            os.utime(path, (time.time() - 120, time.time() - 120))  # age the stored result past the ttl
+            cache = CallbackCache(ttl=60, directory=directory)
+            self.assertEqual(cache.get('a', self.compute(3)), 3)
+            self.assertEqual((cache.disk_hits, cache.misses), (0, 1))
+        self.assertEqual(self.calls, [1, 3])
+
+    def test_disk_maxsize(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = CallbackCache(maxsize=1, ttl=None, directory=directory, disk_maxsize=3)
+            for i in range(5):
+                cache.get(i, self.compute(i))
+                path = cache._path((cache.version, i))
+                os.utime(path, (time.time() - 100 + i, time.time() - 100 + i))  # distinct modification times
+            self.assertEqual(len([name for name in os.listdir(directory) if name.endswith('.pkl')]), 3)
+            self.assertFalse([name for name in os.listdir(directory) if name.endswith('.tmp')])
+            kept = [i for i in range(5) if os.path.exists(cache._path((cache.version, i)))]
+        self.assertEqual(kept, [2, 3, 4])  # the two oldest results were pruned
+
+    def test_version(self):
+        with tempfile.TemporaryDirectory() as directory:
+            CallbackCache(directory=directory, version='old').get('a', self.compute(1))
+            self.assertEqual(CallbackCache(directory=directory, version='old').get('a', self.compute(2)), 1)
+            self.assertEqual(CallbackCache(directory=directory, version='new').get('a', self.compute(3)), 3)
+        self.assertEqual(self.calls, [1, 3])
+
+    def test_memoize_unordered(self):
+        cache = CallbackCache()
+
+        @cache.memoize(unordered=(1,))
+        def heatmap(n_topics, sources, years):
+            self.calls.append((n_topics, sources, years))
+            return len(self.calls)
+
+        self.assertEqual(heatmap(10, ['CNN', 'BBC'], [2012, 2020]), 1)
+        self.assertEqual(heatmap(10, ['BBC', 'CNN'], [2012, 2020]), 1)
+        self.assertEqual(heatmap(10, ['BBC', 'CNN'], [2014, 2020]), 2)
+        self.assertEqual(heatmap(8, ['BBC', 'CNN'], [2012, 2020]), 3)
+        self.assertEqual(heatmap(10, None, [2012, 2020]), 4)
+        self.assertEqual(heatmap(10, [], [2012, 2020]), 4)
+        self.assertEqual((cache.hits, cache.misses), (2, 4))
@@ -0,0 +1,196 @@
+from unittest import TestCase
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # the dashboard modules
+import dashboard_data  # noqa: E402
+
+sources = [('cnnhealth', 'CNN Health'), ('bbchealth', 'BBC Health'), ('KHNews', 'Kaiser Health News')]
+
+
+def topic_results(num_topics, n_tweets=60, seed=0):
+    '''Model results shaped like data/<K>topics.csv, every topic present in every source and year'''
+    rng = np.random.default_rng(seed)
+    username, name = zip(*[sources[i % len(sources)] for i in range(n_tweets)])
+    return pd.DataFrame({'id': np.arange(n_tweets) + 1000,
+                         'date': ['{}-0{}-15 10:00:00'.format(2012 + i % 4, 1 + i % 9) for i in range(n_tweets)],
+                         'username': username, 'name': name, 'num_topics': num_topics,
+                         'dominant_topic': (np.arange(n_tweets) + rng.integers(num_topics, size=n_tweets))
+                         % num_topics})
+
+
+class TestTopicCube(TestCase):
+    '''This class tests that the topic count cube gives the pivot tables the heat maps used to build'''
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.files = []
+        for num_topics in (3, 5):
+            self.files.append(os.path.join(self.directory.name, '{}topics.csv'.format(num_topics)))
+            topic_results(num_topics, seed=num_topics).to_csv(self.files[-1], index=False)
+        data = dashboard_data.write_dashboard_data(self.files, os.path.join(self.directory.name, 'dashboard'))
+        self.cube = dashboard_data.build_topic_cube(data)
+
+        # the frame the dashboard pivoted before, indexed by number of topics
+        self.df = pd.concat([pd.read_csv(file) for file in self.files], ignore_index=True).set_index('num_topics')
+        self.df['date'] = pd.to_datetime(self.df['date'], errors='coerce')
+        self.df['year'] = self.df['date'].dt.year
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def pivot(self, n_topics, selected_sources, years_range):
+        filtered_df = self.df[self.df.name.isin(selected_sources) & self.df.year.isin(years_range)]
+        user_topic_counts = pd.pivot_table(data=filtered_df.loc[n_topics], values='name', index='username',
+                                           columns='dominant_topic', aggfunc='count', fill_value=0)
+        year_topic_counts = pd.pivot_table(data=filtered_df.loc[n_topics], values='date', index='year',
+                                           columns='dominant_topic', aggfunc='count', fill_value=0)
+        user_topic_counts.columns = ['Topic {}'.format(i) for i in range(1, n_topics + 1)]
+        year_topic_counts.columns = ['Topic {}'.format(i) for i in range(1, n_topics + 1)]
+        return user_topic_counts, year_topic_counts
+
+    def assert_counts_equal(self, n_topics, selected_sources, years_range):
+        user_counts, year_counts = dashboard_data.topic_counts(self.cube, n_topics, selected_sources, years_range)
+        user_pivot, year_pivot = self.pivot(n_topics, selected_sources, years_range)
+        np.testing.assert_array_equal(user_counts.values, user_pivot.values)
+        np.testing.assert_array_equal(year_counts.values, year_pivot.values)
+        self.assertEqual(user_counts.index.tolist(), user_pivot.index.tolist())
+        self.assertEqual(year_counts.index.tolist(), year_pivot.index.tolist())
+        self.assertEqual(user_counts.columns.tolist(), user_pivot.columns.tolist())
+
+    def test_cube(self):
+        self.assertEqual(self.cube.num_topics.tolist(), [3, 5])
+        self.assertEqual(self.cube.years.tolist(), [2012, 2013, 2014, 2015])
+        self.assertEqual(self.cube.counts.shape, (2, len(sources), 4, 5))
+        self.assertEqual(self.cube.counts[0, :, :, 3:].sum(), 0)  # topics beyond K are empty
+        self.assertEqual(self.cube.counts.sum(axis=(1, 2, 3)).tolist(), [60, 60])
+
+    def test_matches_pivot_tables(self):
+        all_sources = [name for _, name in sources]
+        self.assert_counts_equal(3, all_sources, [2012, 2013, 2014, 2015])
+        self.assert_counts_equal(5, all_sources, [2012, 2013, 2014, 2015])
+        self.assert_counts_equal(5, ['Kaiser Health News', 'CNN Health'], [2013, 2014, 2015])
+        self.assert_counts_equal(3, ['BBC Health'], [2012, 2013, 2014, 2015, 2016])
+
+
+class TestDashboardData(TestCase):
+    '''This class tests that the dashboard data files round trip the model results'''
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'dashboard')
+        results = topic_results(3, n_tweets=6)
+        results.loc[2, 'date'] = 'not a date'
+        results.loc[4, 'date'] = None
+        self.files = [os.path.join(self.directory.name, '{}topics.csv'.format(num_topics)) for num_topics in (3, 4)]
+        results.to_csv(self.files[0], index=False)
+        results_4 = topic_results(4, n_tweets=6)
+        results_4 = results_4[results_4.id != 1003]  # a tweet missing for K = 4
+        results_4.to_csv(self.files[1], index=False)
+        self.results = results
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        written = dashboard_data.write_dashboard_data(self.files, self.path)
+        for mmap in (True, False):
+            data = dashboard_data.load_dashboard_data(self.path, mmap=mmap)
+            self.assertEqual(data.num_topics, [3, 4])
+            self.assertEqual(data.sources, written.sources)
+            self.assertEqual(data.usernames, [dict((n, u) for u, n in sources)[name] for name in data.sources])
+            for name in ('id', 'source', 'date', 'year', 'dominant_topic'):
+                np.testing.assert_array_equal(getattr(data, name), getattr(written, name))
+            self.assertEqual(isinstance(data.id, np.memmap), mmap)
+
+        self.assertEqual(data.id.tolist(), self.results.id.tolist())
+        self.assertEqual([data.sources[code] for code in data.source], self.results.name.tolist())
+        self.assertEqual(data.dominant_topic.dtype, np.int8)
+        self.assertEqual(data.dominant_topic.shape, (2, 6))
+        self.assertEqual(data.dominant_topic[0].tolist(), self.results.dominant_topic.tolist())
+        self.assertEqual(data.dominant_topic[1, 3], -1)
+        self.assertTrue((data.dominant_topic[1, [0, 1, 2, 4, 5]] >= 0).all())
+
+    def test_bad_dates(self):
+        data = dashboard_data.write_dashboard_data(self.files, self.path)
+        self.assertEqual(data.date.dtype, np.dtype('datetime64[D]'))
+        self.assertTrue(np.isnat(data.date[[2, 4]]).all())
+        self.assertEqual(data.year[[2, 4]].tolist(), [-1, -1])
+        self.assertEqual(data.year[[0, 1, 3, 5]].tolist(), [2012, 2013, 2015, 2013])
+        self.assertEqual(str(data.date[0]), '2012-01-15')
+
+    def test_topic_data_round_trip(self):
+        data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+        topic_words_df = pd.read_pickle(os.path.join(data_dir, 'topic_words.pkl'))
+        topic_names_df = pd.read_pickle(os.path.join(data_dir, 'topic_names.pkl'))
+        dashboard_data.write_topic_data(topic_words_df, topic_names_df, self.path)
+        for mmap in (True, False):
+            loaded_words_df, loaded_names_df = dashboard_data.load_topic_data(self.path, mmap=mmap)
+            # the type of the column labels index depends on the pandas version, the labels themselves must match
+            pd.testing.assert_frame_equal(loaded_words_df, topic_words_df.reset_index(drop=True),
+                                          check_column_type=False)
+            pd.testing.assert_frame_equal(loaded_names_df, topic_names_df.reset_index(drop=True),
+                                          check_column_type=False)
+
+
+class TestPayloads(TestCase):
+    '''This class tests that the precomputed payloads match what the dashboard callbacks used to build'''
+
+    def setUp(self):
+        data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+        self.topic_words_df = pd.read_pickle(os.path.join(data_dir, 'topic_words.pkl'))
+        self.topic_names_df = pd.read_pickle(os.path.join(data_dir, 'topic_names.pkl'))
+
+    def old_topic_descriptions(self, selected_num_topics):
+        '''The body of update_topic_descriptions before the payloads were precomputed'''
+        filtered_df = self.topic_names_df[self.topic_names_df['num_topics'] == selected_num_topics]
+        topic_desc = pd.DataFrame(data=[filtered_df.topic_names.iloc[0].keys(),
+                                        filtered_df.topic_names.iloc[0].values()]).T
+        topic_desc.columns = ['Topic', 'Description']
+        topic_desc['Topic'] += 1
+        data = topic_desc.to_dict('records')
+        columns = [{'id': c, 'name': c} for c in topic_desc.columns]
+        top_words = filtered_df.iloc[0]['top_words']
+        tooltip_data = [{'Description': 'Top 5 words: ' + ', '.join(top_words[topic_num][val][0] for val in range(5))}
+                        for topic_num in range(0, selected_num_topics)]
+        return data, columns, tooltip_data
+
+    def test_topic_table(self):
+        payloads = dashboard_data.build_payloads(self.topic_words_df, self.topic_names_df)
+        self.assertEqual(sorted(payloads), sorted(self.topic_names_df.num_topics.tolist()))
+        for num_topics, payload in payloads.items():
+            data, columns, tooltip_data = self.old_topic_descriptions(num_topics)
+            self.assertEqual(payload['table_data'], data)
+            self.assertEqual(payload['table_columns'], columns)
+            self.assertEqual(payload['tooltip_data'], tooltip_data)
+
+    def test_bubble_figure(self):
+        payloads = dashboard_data.build_payloads(self.topic_words_df, self.topic_names_df)
+        for num_topics, payload in payloads.items():
+            traces = payload['figure']['data']
+            self.assertEqual(len(traces), num_topics)
+            self.assertEqual(payload['trace_visibilities'], [True] + ['legendonly'] * (num_topics - 1))
+            topics = self.topic_words_df[self.topic_words_df['num_clusters'] == num_topics]
+            for topic_num, trace in enumerate(traces):
+                row = topics[topics['topic_num'] == topic_num].iloc[0]
+                self.assertEqual(trace['name'], str(topic_num + 1))
+                self.assertEqual(trace['x'], list(row['doc_count'][0:5]))
+                self.assertEqual(trace['y'], list(row['word_importance'][0:5]))
+                self.assertEqual(trace['text'], list(row['top_words'][0:5]))
+                self.assertEqual(trace['marker']['size'], list(row['num_topic_occurence'][0:5]))
+                self.assertEqual(trace['marker']['sizeref'], 2. * max(row['num_topic_occurence'][0:5]) / (40. ** 2))
+
+    def test_missing_topic_words(self):
+        topic_words_df = self.topic_words_df[self.topic_words_df['num_clusters'] != 4]
+        payloads = dashboard_data.build_payloads(topic_words_df, self.topic_names_df)
+        self.assertNotIn(4, payloads)
+        self.assertIn(5, payloads)
+
+    def test_write_load(self):
+        with tempfile.TemporaryDirectory() as path:
+            payloads = dashboard_data.write_payloads(self.topic_words_df, self.topic_names_df, path)
+            self.assertEqual(dashboard_data.load_payloads(path), payloads)
@@ -0,0 +1,77 @@
+from unittest import TestCase, mock
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # the dashboard modules
+import preprocessor  # noqa: E402
+
+twint_columns = ['id', 'conversation_id', 'created_at', 'date', 'timezone', 'place', 'tweet', 'hashtags',
+                 'cashtags', 'user_id', 'user_id_str', 'username', 'name', 'day', 'hour', 'link', 'retweet',
+                 'nlikes', 'nreplies', 'nretweets', 'quote_url', 'search', 'near', 'geo', 'source', 'video',
+                 'reply_to']
+
+
+def twint_rows(start, tweets, username):
+    '''Rows shaped like a Twint dump, with the blank columns Twint leaves in most tweets'''
+    rows = []
+    for i, tweet in enumerate(tweets, start):
+        rows.append({'id': 1000 + i, 'conversation_id': 1000 + i, 'created_at': 1577836800000 + i,
+                     'date': '2020-01-{:02d} 08:00:00'.format(i % 28 + 1), 'timezone': 'EST',
+                     'place': 'NYC' if i % 3 == 0 else None, 'tweet': tweet, 'hashtags': '[]', 'cashtags': '[]',
+                     'user_id': 42, 'user_id_str': '42', 'username': username, 'name': username.upper(),
+                     'day': i % 7 + 1, 'hour': i % 24, 'link': 'https://twitter.com/x/status/{}'.format(i),
+                     'retweet': i % 2 == 0, 'nlikes': i * 3, 'nreplies': i, 'nretweets': i * 2,
+                     'quote_url': None, 'search': 'health', 'near': None, 'geo': None, 'source': None,
+                     'video': i % 2, 'reply_to': "[{'user_id': '42'}]"})
+    return pd.DataFrame(rows, columns=twint_columns)
+
+
+def baseline_merge(files):
+    '''The in-memory merge that preprocessor.py ran before it was streamed'''
+    tweets_df = pd.concat([pd.read_csv(file) for file in files], ignore_index=True)
+    tweets_df = tweets_df.dropna(axis='columns')
+    tweets_df = tweets_df.drop(columns=['conversation_id', 'created_at', 'cashtags', 'user_id',
+                                        'user_id_str', 'link', 'search', 'reply_to'])
+    tweets_df.drop_duplicates(keep=False, inplace=True, subset='tweet')
+    return tweets_df
+
+
+class TestMergeTweets(TestCase):
+    '''This class tests that the streamed merge matches the original in-memory merge'''
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        frames = [
+            twint_rows(0, ['flu season starts early', 'new vaccine trial', 'sleep and heart health',
+                           'flu season starts early', 'coffee linked to longer life'], 'cnnhealth'),
+            twint_rows(5, ['new vaccine trial', 'obesity rates rise', 'measles cases climb',
+                           'flu season starts early', 'walking lowers risk'], 'nytHealth'),
+            twint_rows(10, ['mental health at work', 'obesity rates rise', 'drug prices fall'], 'KHNews'),
+        ]
+        self.files = []
+        for i, frame in enumerate(frames):
+            self.files.append(os.path.join(self.directory.name, 'tweets{}.csv'.format(i)))
+            frame.to_csv(self.files[-1], index=False)
+        self.output_path = os.path.join(self.directory.name, 'health_tweets.csv')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_matches_baseline(self):
+        expected = baseline_merge(self.files)
+        with mock.patch.object(preprocessor, 'chunk_size', 2):  # several chunks per file
+            num_tweets = preprocessor.merge_tweets(self.files, self.output_path)
+        merged = pd.read_csv(self.output_path)
+        self.assertEqual(num_tweets, len(expected))
+        self.assertIn('video', merged.columns)
+        self.assertNotIn('place', merged.columns)  # blank in some tweets
+        pd.testing.assert_frame_equal(merged, expected.reset_index(drop=True))
+
+    def test_drops_every_copy_of_duplicates(self):
+        preprocessor.merge_tweets(self.files, self.output_path)
+        tweets = pd.read_csv(self.output_path).tweet.tolist()
+        self.assertEqual(tweets, ['sleep and heart health', 'coffee linked to longer life', 'measles cases climb',
+                                  'walking lowers risk', 'mental health at work', 'drug prices fall'])